@@ -1,3 +1,3 @@
 # from .pcmd import main, version, CmdPreprocessor
-from .preprocessor import Preprocessor, OutputDirective, Action
+from .preprocessor import Preprocessor, OutputDirective, Action, FastLexer, IncludePrefetcher, PreprocessorStats
 # __version__ = version
@@ -11,7 +11,7 @@
 
 from __future__ import generators, print_function, absolute_import
 
-__all__ = ['Preprocessor', 'PreprocessorHooks', 'OutputDirective', 'Action']
+__all__ = ['Preprocessor', 'PreprocessorHooks', 'OutputDirective', 'Action', 'FastLexer', 'IncludePrefetcher', 'PreprocessorStats']
 
 import sys, traceback, time
 
@@ -196,6 +196,178 @@ _trigraph_rep = {
 def trigraph(input):
     return _trigraph_pat.sub(lambda g: _trigraph_rep[g.group()[-1]],input)
 
+# ------------------------------------------------------------------
+# FastLexer object
+#
+# A specialised tokenizer for the fixed token set defined at the top of
+# this file. It produces exactly the same tokens as the generic ply lexer,
+# but matches a single compiled pattern and dispatches on the name of the
+# matching group instead of calling a Python rule function per token. Lines
+# can be tokenized in one batch via lines(), which is what group_lines() uses.
+# ------------------------------------------------------------------
+
+# The rules in the order that ply's lex() tries them: the function rules in
+# definition order, then the string rules sorted by decreasing regex length
+_fast_rules = (
+    ('CPP_WS', t_CPP_WS.__doc__),
+    ('CPP_INTEGER', CPP_INTEGER.__doc__),
+    ('CPP_STRING', t_CPP_STRING.__doc__),
+    ('CPP_CHAR', t_CPP_CHAR.__doc__),
+    ('CPP_COMMENT1', t_CPP_COMMENT1.__doc__),
+    ('CPP_COMMENT2', t_CPP_COMMENT2.__doc__),
+    ('CPP_FLOAT', t_CPP_FLOAT),
+    ('CPP_ID', t_CPP_ID),
+    ('CPP_DPOUND', t_CPP_DPOUND),
+    ('CPP_LOGICALOR', t_CPP_LOGICALOR),
+    ('CPP_PLUSPLUS', t_CPP_PLUSPLUS),
+    ('CPP_OREQUAL', t_CPP_OREQUAL),
+    ('CPP_MULTIPLYEQUAL', t_CPP_MULTIPLYEQUAL),
+    ('CPP_PLUSEQUAL', t_CPP_PLUSEQUAL),
+    ('CPP_LSHIFTEQUAL', t_CPP_LSHIFTEQUAL),
+    ('CPP_RSHIFTEQUAL', t_CPP_RSHIFTEQUAL),
+    ('CPP_POUND', t_CPP_POUND),
+    ('CPP_PLUS', t_CPP_PLUS),
+    ('CPP_STAR', t_CPP_STAR),
+    ('CPP_BAR', t_CPP_BAR),
+    ('CPP_HAT', t_CPP_HAT),
+    ('CPP_QUESTION', t_CPP_QUESTION),
+    ('CPP_LPAREN', t_CPP_LPAREN),
+    ('CPP_RPAREN', t_CPP_RPAREN),
+    ('CPP_LBRACKET', t_CPP_LBRACKET),
+    ('CPP_RBRACKET', t_CPP_RBRACKET),
+    ('CPP_BSLASH', t_CPP_BSLASH),
+    ('CPP_DEREFERENCE', t_CPP_DEREFERENCE),
+    ('CPP_MINUSEQUAL', t_CPP_MINUSEQUAL),
+    ('CPP_MINUSMINUS', t_CPP_MINUSMINUS),
+    ('CPP_LSHIFT', t_CPP_LSHIFT),
+    ('CPP_LESSEQUAL', t_CPP_LESSEQUAL),
+    ('CPP_RSHIFT', t_CPP_RSHIFT),
+    ('CPP_GREATEREQUAL', t_CPP_GREATEREQUAL),
+    ('CPP_LOGICALAND', t_CPP_LOGICALAND),
+    ('CPP_ANDEQUAL', t_CPP_ANDEQUAL),
+    ('CPP_EQUALITY', t_CPP_EQUALITY),
+    ('CPP_INEQUALITY', t_CPP_INEQUALITY),
+    ('CPP_XOREQUAL', t_CPP_XOREQUAL),
+    ('CPP_DIVIDEEQUAL', t_CPP_DIVIDEEQUAL),
+    ('CPP_PERCENTEQUAL', t_CPP_PERCENTEQUAL),
+    ('CPP_MINUS', t_CPP_MINUS),
+    ('CPP_FSLASH', t_CPP_FSLASH),
+    ('CPP_PERCENT', t_CPP_PERCENT),
+    ('CPP_AMPERSAND', t_CPP_AMPERSAND),
+    ('CPP_TILDE', t_CPP_TILDE),
+    ('CPP_LESS', t_CPP_LESS),
+    ('CPP_GREATER', t_CPP_GREATER),
+    ('CPP_EQUAL', t_CPP_EQUAL),
+    ('CPP_EXCLAMATION', t_CPP_EXCLAMATION),
+    ('CPP_LCURLY', t_CPP_LCURLY),
+    ('CPP_RCURLY', t_CPP_RCURLY),
+    ('CPP_DOT', t_CPP_DOT),
+    ('CPP_COMMA', t_CPP_COMMA),
+    ('CPP_SEMICOLON', t_CPP_SEMICOLON),
+    ('CPP_COLON', t_CPP_COLON),
+    ('CPP_SQUOTE', t_CPP_SQUOTE),
+    ('CPP_DQUOTE', t_CPP_DQUOTE),
+)
+
+# ply compiles its master regex with re.VERBOSE, which CPP_FLOAT relies upon
+_fast_re = re.compile('|'.join('(?P<%s>%s)' % rule for rule in _fast_rules), re.VERBOSE)
+
+# Token types which may contain newlines, and so advance the line number
+_fast_multiline = frozenset(('CPP_WS', 'CPP_STRING', 'CPP_CHAR', 'CPP_COMMENT1'))
+
+class FastLexer(object):
+    """Specialised lexer for the preprocessor token set. Provides the subset of
+    the ply Lexer interface used by Preprocessor: input(), token(), clone() and
+    lineno, plus lines() to tokenize a whole input a line at a time."""
+    def __init__(self):
+        self.lexdata = ''
+        self.lexpos = 0
+        self.lexlen = 0
+        self.lineno = 1
+
+    def clone(self):
+        return copy.copy(self)
+
+    def input(self,s):
+        if not isinstance(s, STRING_TYPES):
+            raise ValueError('Expected a string')
+        self.lexdata = s
+        self.lexpos = 0
+        self.lexlen = len(s)
+
+    def token(self):
+        """Return the next token, or None at the end of the input"""
+        lexpos = self.lexpos
+        if lexpos >= self.lexlen:
+            return None
+        tok = LexToken()
+        tok.lineno = self.lineno
+        tok.lexpos = lexpos
+        m = _fast_re.match(self.lexdata, lexpos)
+        if m is None:
+            # Same as t_error(): the unmatched character becomes its own type
+            tok.type = tok.value = self.lexdata[lexpos]
+            self.lexpos = lexpos + 1
+            return tok
+        tok.type = m.lastgroup
+        tok.value = value = m.group()
+        if tok.type in _fast_multiline:
+            self.lineno += value.count('\n')
+        self.lexpos = m.end()
+        return tok
+
+    def lines(self,source):
+        """Tokenize the remaining input in one pass, yielding a list of tokens
+        for each line. Every token gets the given source, and the final line is
+        terminated with a newline token if the input doesn't end with one."""
+        data = self.lexdata
+        lexpos = self.lexpos
+        lineno = self.lineno
+        multiline = _fast_multiline
+        current_line = []
+        append = current_line.append
+        for m in _fast_re.finditer(data, lexpos):
+            start = m.start()
+            while lexpos < start:
+                # Characters skipped by finditer are handled as t_error() does
+                tok = LexToken()
+                tok.type = tok.value = data[lexpos]
+                tok.lineno = lineno
+                tok.lexpos = lexpos
+                tok.source = source
+                append(tok)
+                lexpos += 1
+            tok = LexToken()
+            tok.type = type = m.lastgroup
+            tok.value = value = m.group()
+            tok.lineno = lineno
+            tok.lexpos = start
+            tok.source = source
+            append(tok)
+            lexpos = m.end()
+            if type in multiline and '\n' in value:
+                lineno += value.count('\n')
+                if type == 'CPP_WS':
+                    yield current_line
+                    current_line = []
+                    append = current_line.append
+        while lexpos < self.lexlen:
+            tok = LexToken()
+            tok.type = tok.value = data[lexpos]
+            tok.lineno = lineno
+            tok.lexpos = lexpos
+            tok.source = source
+            append(tok)
+            lexpos += 1
+        self.lexpos = lexpos
+        self.lineno = lineno
+        if current_line:
+            nltok = copy.copy(current_line[-1])
+            nltok.type = 'CPP_WS'
+            nltok.value = '\n'
+            current_line.append(nltok)
+            yield current_line
+
 # ------------------------------------------------------------------
 # Macro object
 #
@@ -221,6 +393,7 @@ class Macro(object):
         if variadic:
             self.vararg = arglist[-1]
         self.source = None
+        self.volatile = False
     def __repr__(self):
         return "%s(%s)=%s" % (self.name, self.arglist, self.value)
 
@@ -368,6 +541,187 @@ class FileInclusionTime(object):
         self.depth = depth
         self.elapsed = 0.0
 
+# ------------------------------------------------------------------
+# Preprocessor statistics
+#
+# Set Preprocessor.stats to a PreprocessorStats to find out where the
+# time goes. Times are in seconds, and for macros include the time spent
+# expanding any macros nested within them
+# ------------------------------------------------------------------
+
+class PreprocessorStats(object):
+    """Counters collected by the preprocessor when Preprocessor.stats is set.
+    The same object may be used with several preprocessors to add them up."""
+    def __init__(self):
+        self.files = {}          # file -> {'tokens'}
+        self.macros = {}         # macro name -> {'expansions', 'time'}
+        self.expressions = {}    # 'file:line' -> {'calls', 'time'}
+        self.includes = {}       # included file -> {'cache_hits', 'cache_misses', 'skipped_once'}
+        self.macro_cache = {'hits': 0, 'misses': 0}
+
+    def file(self,source):
+        s = self.files.get(source)
+        if s is None:
+            s = self.files[source] = {'tokens': 0}
+        return s
+
+    def macro(self,name,elapsed):
+        s = self.macros.get(name)
+        if s is None:
+            s = self.macros[name] = {'expansions': 0, 'time': 0.0}
+        s['expansions'] += 1
+        s['time'] += elapsed
+
+    def expression(self,location,elapsed):
+        s = self.expressions.get(location)
+        if s is None:
+            s = self.expressions[location] = {'calls': 0, 'time': 0.0}
+        s['calls'] += 1
+        s['time'] += elapsed
+
+    def include(self,fulliname,what):
+        s = self.includes.get(fulliname)
+        if s is None:
+            s = self.includes[fulliname] = {'cache_hits': 0, 'cache_misses': 0, 'skipped_once': 0}
+        s[what] += 1
+
+    def as_dict(self):
+        """Returns the statistics as a dict suitable for dumping as JSON, with
+        the most expensive macros and expressions first"""
+        return {
+            'files': self.files,
+            'macros': dict(sorted(self.macros.items(), key=lambda i: -i[1]['time'])),
+            'expressions': dict(sorted(self.expressions.items(), key=lambda i: -i[1]['time'])),
+            'includes': self.includes,
+            'macro_cache': self.macro_cache,
+        }
+
+# ------------------------------------------------------------------
+# Include recordings
+#
+# Records what preprocessing an #include read from and did to the
+# preprocessor state, so that including the same file again under
+# the same macro context can replay the result
+# ------------------------------------------------------------------
+
+class IncludeRecording(object):
+    """The inputs and effects of preprocessing an included file.
+
+        .reads        - Names of macros looked at by conditionals and expansions
+        .read_values  - Macro name -> Macro (or None) for each read, as it was beforehand
+        .pre_values   - Macro name -> Macro (or None) before the file first changed it
+        .once_reads   - Include path -> whether it was in include_once when checked
+        .writes       - Macro name -> Macro (or None if undefined) after the include
+        .once_writes  - Entries added to include_once
+        .tokens       - The output tokens
+        .include_times - FileInclusionTime for the file and everything it included
+    """
+    def __init__(self):
+        self.reads = set()
+        self.pre_values = {}
+        self.once_reads = {}
+        self.read_values = None
+        self.writes = None
+        self.once_writes = None
+        self.tokens = []
+        self.include_times = None
+        self.cacheable = True
+
+    def merge_into(self,parent):
+        """What a nested include read or changed, its includer did too"""
+        parent.reads.update(self.reads)
+        for name, m in self.pre_values.items():
+            parent.pre_values.setdefault(name, m)
+        for name, seen in self.once_reads.items():
+            parent.once_reads.setdefault(name, seen)
+        parent.cacheable = parent.cacheable and self.cacheable
+
+# ------------------------------------------------------------------
+# Include prefetching
+#
+# Reads the files named by #include lines on a thread pool, so that
+# file system latency overlaps with preprocessing
+# ------------------------------------------------------------------
+
+_include_line_pat = re.compile(r'''^[ \t]*\#[ \t]*include[ \t]*(?:"([^"\n]+)"|<([^>\n]+)>)''', re.M)
+
+def read_source(fulliname):
+    """Reads a source file, trying the platform encoding first and UTF-8 second"""
+    try:
+        with open(fulliname,"r") as ih:
+            return ih.read()
+    except UnicodeDecodeError:
+        with open(fulliname,"r", encoding="utf-8-sig") as ih:
+            return ih.read()
+
+class IncludePrefetcher(object):
+    """Starts reading the files a source file includes as soon as the preprocessor
+    begins on it. For each #include, the search path is tried in order on a worker
+    thread until the file is found. Set Preprocessor.prefetcher to use it, and call
+    close() when preprocessing is done."""
+    _not_read = object()
+
+    def __init__(self,workers=4):
+        from concurrent.futures import ThreadPoolExecutor
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.files = {}         # abspath -> Future of the contents, or None if missing
+
+    def scan(self,input,path,temp_path,include_once):
+        """Starts reading the targets of the #include lines in input"""
+        for m in _include_line_pat.finditer(input):
+            quoted, system = m.groups()
+            if quoted:
+                candidates = [os.path.abspath(os.path.join(p,quoted)) for p in (temp_path + path or [''])]
+            else:
+                candidates = [os.path.abspath(os.path.join(p,system)) for p in (path or [''])]
+            candidates = [c for c in candidates if c not in self.files]
+            if not candidates or candidates[0] in include_once:
+                continue
+            futures = []
+            for c in candidates:
+                f = self.files[c] = self._future()
+                futures.append((c, f))
+            self.executor.submit(self._read, futures)
+
+    def _future(self):
+        from concurrent.futures import Future
+        return Future()
+
+    def _read(self,futures):
+        for n, (fulliname, f) in enumerate(futures):
+            try:
+                data = read_source(fulliname)
+            except Exception:
+                f.set_result(None)
+                continue
+            f.set_result(data)
+            # The search stops at the first file found, as include() does
+            for _, f in futures[n+1:]:
+                f.set_result(self._not_read)
+            return
+
+    def read(self,fulliname):
+        """Returns the contents of fulliname if it was prefetched, raises IOError
+        if it was found not to exist, or returns None if it wasn't prefetched"""
+        f = self.files.pop(fulliname, None)
+        if f is None:
+            return None
+        data = f.result()
+        if data is self._not_read:
+            return None
+        if data is None:
+            raise IOError("No such file: " + fulliname)
+        return data
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.files = {}
+
+def _macro_signature(m):
+    if m is None:
+        return None
+    return (m.arglist and tuple(m.arglist), m.variadic, tuple((t.type, t.value) for t in m.value))
+
 # ------------------------------------------------------------------
 # Preprocessor object
 #
@@ -393,13 +747,20 @@ class Preprocessor(PreprocessorHooks):
         self.auto_pragma_once_enabled = True
         self.line_directive = '#line'
         self.compress = False
+        self.cache_macro_expansions = True
+        self.macro_cache = {}    # (name, expanding_from) -> (expansion, {dependency: Macro})
+        self.expanding_deps = [] # identifiers seen by each object-like macro expansion in progress
+        self.cache_includes = True
+        self.include_cache = {}  # (abspath, temp_path) -> [IncludeRecording]
+        self.include_recordings = [] # recordings of the #includes in progress
+        self.prefetcher = None   # IncludePrefetcher
+        self.stats = None        # PreprocessorStats
 
         # Probe the lexer for selected tokens
         self.__lexprobe()
 
-        tm = time.localtime()
-        self.define("__DATE__ \"%s\"" % time.strftime("%b %d %Y",tm))
-        self.define("__TIME__ \"%s\"" % time.strftime("%H:%M:%S",tm))
+        self.volatile_macros = set()
+        self.define_date()
         self.define("__PCPP__ 1")
         self.expand_linemacro = True
         self.expand_filemacro = True
@@ -582,6 +943,11 @@ class Preprocessor(PreprocessorHooks):
         lex.input(input)
         lex.lineno = 1
 
+        if isinstance(lex, FastLexer):
+            for current_line in lex.lines(abssource):
+                yield current_line
+            return
+
         current_line = []
         while True:
             tok = lex.token()
@@ -861,6 +1227,72 @@ class Preprocessor(PreprocessorHooks):
         return rep
 
 
+    # ----------------------------------------------------------------------
+    # expand_object_macro()
+    #
+    # Returns the fully expanded replacement list of an object-like macro,
+    # reusing a cached expansion when nothing it depends on has changed
+    # ----------------------------------------------------------------------
+
+    def expand_object_macro(self,macro,expanding_from):
+        """Returns the fully expanded replacement list of an object-like macro.
+
+        Expansions are cached along with the macros that every identifier looked
+        at during the expansion resolved to. A cached expansion is only reused if
+        all of those are still the same Macro objects (or still undefined), so
+        redefining or undefining the macro or anything it depends upon invalidates
+        it. The caller stamps the returned tokens with its source and line number."""
+        if macro.volatile:
+            self.volatile_macros.add(macro.name)
+        if not self.cache_macro_expansions:
+            return self.expand_macros([copy.copy(_x) for _x in macro.value], expanding_from)
+
+        key = (macro.name, tuple(expanding_from))
+        cached = self.macro_cache.get(key)
+        if cached is not None:
+            expansion, snapshot = cached
+            macros = self.macros
+            for name, m in snapshot.items():
+                if macros.get(name) is not m:
+                    break
+            else:
+                if self.stats is not None:
+                    self.stats.macro_cache['hits'] += 1
+                if self.expanding_deps:
+                    self.expanding_deps[-1].update(snapshot)
+                if self.include_recordings:
+                    self.include_recordings[-1].reads.update(snapshot)
+                ex = []
+                for _x in expansion:
+                    e = copy.copy(_x)
+                    e.expanded_from = list(_x.expanded_from)
+                    ex.append(e)
+                return ex
+
+        if self.stats is not None:
+            self.stats.macro_cache['misses'] += 1
+        deps = set()
+        self.expanding_deps.append(deps)
+        try:
+            ex = self.expand_macros([copy.copy(_x) for _x in macro.value], expanding_from)
+        finally:
+            self.expanding_deps.pop()
+        if self.expanding_deps:
+            self.expanding_deps[-1].update(deps)
+
+        # None marks an expansion which reported errors. __LINE__ and __COUNTER__
+        # expand differently every time, so neither can be cached
+        if None not in deps and '__LINE__' not in deps and '__COUNTER__' not in deps:
+            snapshot = dict((name, self.macros.get(name)) for name in deps)
+            snapshot[macro.name] = macro
+            expansion = []
+            for e in ex:
+                _x = copy.copy(e)
+                _x.expanded_from = list(e.expanded_from)
+                expansion.append(_x)
+            self.macro_cache[key] = (expansion, snapshot)
+        return ex
+
     # ----------------------------------------------------------------------
     # expand_macros()
     #
@@ -873,6 +1305,10 @@ class Preprocessor(PreprocessorHooks):
         for tok in tokens:
             if not hasattr(tok, 'expanded_from'):
                 tok.expanded_from = []
+        # When expanding an object-like macro for the macro cache, every identifier looked at is a dependency
+        deps = self.expanding_deps[-1] if self.expanding_deps else None
+        reads = self.include_recordings[-1].reads if self.include_recordings else None
+        stats = self.stats
         i = 0
         #print "*** EXPAND MACROS in", "".join([t.value for t in tokens]), "expanding_from=", expanding_from
         #print tokens
@@ -883,13 +1319,18 @@ class Preprocessor(PreprocessorHooks):
                 self.linemacro = t.lineno
             self.linemacrodepth = self.linemacrodepth + 1
             if t.type == self.t_ID:
+                if deps is not None:
+                    deps.add(t.value)
+                if reads is not None:
+                    reads.add(t.value)
                 if t.value in self.macros and t.value not in t.expanded_from and t.value not in expanding_from:
                     # Yes, we found a macro match
                     m = self.macros[t.value]
+                    if stats is not None:
+                        began = clock()
                     if m.arglist is None:
                         # A simple macro
-                        rep = [copy.copy(_x) for _x in m.value]
-                        ex = self.expand_macros(rep, expanding_from + [t.value])
+                        ex = self.expand_object_macro(m, expanding_from + [t.value])
                         #print "\nExpanding macro", m, "\ninto", ex, "\nreplacing", tokens[i:i+1]
                         for e in ex:
                             e.source = t.source
@@ -898,6 +1339,8 @@ class Preprocessor(PreprocessorHooks):
                                 e.expanded_from = []
                             e.expanded_from.append(t.value)
                         tokens[i:i+1] = ex
+                        if stats is not None:
+                            stats.macro(t.value, clock() - began)
                     else:
                         # A macro with arguments
                         j = i + 1
@@ -915,9 +1358,13 @@ class Preprocessor(PreprocessorHooks):
                                 # A no arg or single arg consuming macro is permitted to be expanded with nothing
                                 and (args != [[]] or len(m.arglist) > 1)
                                 and len(args) !=  len(m.arglist)):
+                                if deps is not None:
+                                    deps.add(None)
                                 self.on_error(t.source,t.lineno,"Macro %s requires %d arguments but was passed %d" % (t.value,len(m.arglist),len(args)))
                                 i = j + tokcount
                             elif m.variadic and len(args) < len(m.arglist)-1:
+                                if deps is not None:
+                                    deps.add(None)
                                 if len(m.arglist) > 2:
                                     self.on_error(t.source,t.lineno,"Macro %s must have at least %d arguments" % (t.value, len(m.arglist)-1))
                                 else:
@@ -956,6 +1403,8 @@ class Preprocessor(PreprocessorHooks):
                                     ex.append(newtok)
                                 #print("\nExpanding macro", m, "\ninto", ex, "\nreplacing", tokens[i:j+tokcount])
                                 tokens[i:j+tokcount] = ex
+                                if stats is not None:
+                                    stats.macro(t.value, clock() - began)
                     self.linemacrodepth = self.linemacrodepth - 1
                     if self.linemacrodepth == 0:
                         self.linemacro = 0
@@ -984,6 +1433,16 @@ class Preprocessor(PreprocessorHooks):
     def evalexpr(self,tokens):
         """Evaluate an expression token sequence for the purposes of evaluating
         integral expressions."""
+        if self.stats is None:
+            return self._evalexpr(tokens)
+        location = "%s:%d" % (tokens[0].source, tokens[0].lineno) if tokens else 'unknown'
+        began = clock()
+        try:
+            return self._evalexpr(tokens)
+        finally:
+            self.stats.expression(location, clock() - began)
+
+    def _evalexpr(self,tokens):
         if not tokens:
             self.on_error('unknown', 0, "Empty expression")
             return (0, None)
@@ -1003,6 +1462,8 @@ class Preprocessor(PreprocessorHooks):
                             j += 1
                             continue
                         elif tokens[j].type == self.t_ID:
+                            if self.include_recordings:
+                                self.include_recordings[-1].reads.add(tokens[j].value)
                             if tokens[j].value in self.macros:
                                 result = "1L"
                             else:
@@ -1144,6 +1605,9 @@ class Preprocessor(PreprocessorHooks):
                         rewritten_source = rewritten_source.replace(os.sep, '/')
                     break
 
+        if self.prefetcher is not None:
+            self.prefetcher.scan(input, self.path, self.temp_path, self.include_once)
+
         # Replace trigraph sequences
         t = trigraph(input)
         lines = self.group_lines(t, rewritten_source)
@@ -1181,7 +1645,11 @@ class Preprocessor(PreprocessorHooks):
         include_guard = None
         self.on_potential_include_guard(None)
 
+        file_stats = self.stats.file(rewritten_source) if self.stats is not None else None
+
         for x in lines:
+            if file_stats is not None:
+                file_stats['tokens'] += len(x)
             all_whitespace = True
             skip_auto_pragma_once_possible_check = False
             # Handle comments
@@ -1269,6 +1737,8 @@ class Preprocessor(PreprocessorHooks):
                         ifstack.append(ifstackentry(enable,iftrigger,ifpassthru,x))
                         if enable:
                             ifpassthru = False
+                            if self.include_recordings:
+                                self.include_recordings[-1].reads.add(args[0].value)
                             if not args[0].value in self.macros:
                                 res = self.on_unknown_macro_in_defined_expr(args[0])
                                 if res is None:
@@ -1290,6 +1760,8 @@ class Preprocessor(PreprocessorHooks):
                         ifstack.append(ifstackentry(enable,iftrigger,ifpassthru,x))
                         if enable:
                             ifpassthru = False
+                            if self.include_recordings:
+                                self.include_recordings[-1].reads.add(args[0].value)
                             if args[0].value in self.macros:
                                 enable = False
                                 iftrigger = False
@@ -1500,23 +1972,41 @@ class Preprocessor(PreprocessorHooks):
             for p in path:
                 iname = os.path.join(p,filename)
                 fulliname = os.path.abspath(iname)
+                if self.include_recordings:
+                    self.include_recordings[-1].once_reads.setdefault(fulliname, fulliname in self.include_once)
                 if fulliname in self.include_once:
                     if self.debugout is not None:
                         print("x:x:x x:x #include \"%s\" skipped as already seen" % (fulliname), file = self.debugout)
+                    if self.stats is not None:
+                        self.stats.include(fulliname, 'skipped_once')
                     return
+                cache_key = (fulliname, tuple(self.temp_path))
+                if self.cache_includes:
+                    recording = self.find_include_recording(cache_key)
+                    if self.stats is not None and os.path.exists(fulliname):
+                        self.stats.include(fulliname, 'cache_misses' if recording is None else 'cache_hits')
+                    if recording is not None:
+                        if self.debugout is not None:
+                            print("x:x:x x:x #include \"%s\" replayed from an earlier inclusion" % (fulliname), file = self.debugout)
+                        for tok in self.replay_include(recording):
+                            yield tok
+                        return
                 try:
-                    try:
-                        with open(fulliname,"r") as ih:    # platform encoding first
-                            data = ih.read()
-                    except UnicodeDecodeError:
-                        with open(fulliname,"r", encoding="utf-8-sig") as ih: # utf-8 second
-                            data = ih.read()
+                    data = None
+                    if self.prefetcher is not None:
+                        data = self.prefetcher.read(fulliname)
+                    if data is None:
+                        data = read_source(fulliname)
                     
                     dname = os.path.dirname(fulliname)
                     if dname:
                         self.temp_path.insert(0,dname)
-                    for tok in self.parsegen(data,filename,fulliname):
-                        yield tok
+                    if self.cache_includes:
+                        for tok in self.record_include(cache_key,self.parsegen(data,filename,fulliname)):
+                            yield tok
+                    else:
+                        for tok in self.parsegen(data,filename,fulliname):
+                            yield tok
                     if dname:
                         del self.temp_path[0]
                     return
@@ -1527,6 +2017,123 @@ class Preprocessor(PreprocessorHooks):
                 assert p is not None
                 path.append(p)
 
+    # ----------------------------------------------------------------------
+    # record_include()
+    #
+    # Records the inputs and effects of an #include while passing its tokens through
+    # ----------------------------------------------------------------------
+
+    def record_include(self,cache_key,tokens):
+        """Passes through the tokens of an included file, recording what its
+        preprocessing read and changed so that find_include_recording() can
+        reuse it"""
+        rec = IncludeRecording()
+        include_times_idx = len(self.include_times)
+        include_once = set(self.include_once)
+        return_code = self.return_code
+        countermacro = self.countermacro
+
+        self.include_recordings.append(rec)
+        try:
+            for tok in tokens:
+                rec.tokens.append(copy.copy(tok))
+                yield tok
+        finally:
+            self.include_recordings.pop()
+        if self.include_recordings:
+            rec.merge_into(self.include_recordings[-1])
+
+        # Anything which reported errors or used __COUNTER__ must be done again.
+        # There's no point keeping files which can never be included again
+        fulliname = cache_key[0]
+        if (not rec.cacheable or self.return_code != return_code or self.countermacro != countermacro
+                or fulliname in self.include_once):
+            rec.cacheable = False
+            return
+
+        rec.read_values = dict((name, rec.pre_values[name] if name in rec.pre_values else self.macros.get(name))
+                               for name in rec.reads)
+        rec.writes = dict((name, self.macros.get(name)) for name in rec.pre_values)
+        rec.once_writes = dict((k, v) for k, v in self.include_once.items() if k not in include_once)
+        rec.include_times = self.include_times[include_times_idx:]
+        self.include_cache.setdefault(cache_key, []).append(rec)
+
+    # ----------------------------------------------------------------------
+    # find_include_recording()
+    #
+    # Finds a recording of an #include made under the current macro context
+    # ----------------------------------------------------------------------
+
+    def find_include_recording(self,cache_key):
+        """Returns a recording of including a file that read the same macros
+        with the same values as they have now, or None"""
+        for rec in self.include_cache.get(cache_key, ()):
+            for name, seen in rec.once_reads.items():
+                if (name in self.include_once) != seen:
+                    break
+            else:
+                for name, then in rec.read_values.items():
+                    now = self.macros.get(name)
+                    if now is not then and _macro_signature(now) != _macro_signature(then):
+                        break
+                else:
+                    return rec
+        return None
+
+    # ----------------------------------------------------------------------
+    # replay_include()
+    #
+    # Applies the effects of a recorded #include and returns its tokens
+    # ----------------------------------------------------------------------
+
+    def replay_include(self,rec):
+        """Applies the macro table and include_once changes of a recorded
+        #include, and yields copies of the tokens it output"""
+        if self.include_recordings:
+            parent = self.include_recordings[-1]
+            for name in rec.writes:
+                parent.pre_values.setdefault(name, self.macros.get(name))
+            rec.merge_into(parent)
+        for name, m in rec.writes.items():
+            if m is None:
+                self.macros.pop(name, None)
+            else:
+                self.macros[name] = m
+        self.include_once.update(rec.once_writes)
+        including_path = self.macros['__FILE__'] if '__FILE__' in self.macros else None
+        depth = self.include_depth - rec.include_times[0].depth
+        for i, t in enumerate(rec.include_times):
+            t = FileInclusionTime(including_path if i == 0 else t.including_path, t.included_path, t.included_abspath, t.depth + depth)
+            self.include_times.append(t)
+        for tok in rec.tokens:
+            yield copy.copy(tok)
+
+    # ----------------------------------------------------------------------
+    # define_date()
+    #
+    # Define __DATE__ and __TIME__
+    # ----------------------------------------------------------------------
+
+    def define_date(self,tm=None):
+        """Defines __DATE__ and __TIME__ from the struct_time tm.
+
+        If tm is None, the time given by SOURCE_DATE_EPOCH is used if that is set in
+        the environment, otherwise the current local time is used. The macros are then
+        marked as volatile, and the names of any volatile macros that get expanded are
+        added to volatile_macros, as output using them differs from run to run."""
+        volatile = False
+        if tm is None:
+            epoch = os.environ.get('SOURCE_DATE_EPOCH')
+            if epoch:
+                tm = time.gmtime(int(epoch))
+            else:
+                tm = time.localtime()
+                volatile = True
+        self.define("__DATE__ \"%s\"" % time.strftime("%b %d %Y",tm))
+        self.define("__TIME__ \"%s\"" % time.strftime("%H:%M:%S",tm))
+        self.macros['__DATE__'].volatile = volatile
+        self.macros['__TIME__'].volatile = volatile
+
     # ----------------------------------------------------------------------
     # define()
     #
@@ -1543,6 +2150,8 @@ class Preprocessor(PreprocessorHooks):
         linetok = tokens
         try:
             name = linetok[0]
+            if self.include_recordings:
+                self.include_recordings[-1].pre_values.setdefault(name.value, self.macros.get(name.value))
             if len(linetok) > 1:
                 mtype = linetok[1]
             else:
@@ -1616,6 +2225,8 @@ class Preprocessor(PreprocessorHooks):
         if isinstance(tokens,STRING_TYPES):
             tokens = self.tokenize(tokens)
         id = tokens[0].value
+        if self.include_recordings:
+            self.include_recordings[-1].pre_values.setdefault(id, self.macros.get(id))
         try:
             del self.macros[id]
         except LookupError:
@@ -0,0 +1,665 @@
+'''
+    Works out which fields of the parsed headers the templates can use, by
+    walking the syntax tree of each template. The result is used to prune
+    the rest of the model (see :mod:`.prune`) and to skip collecting doxygen
+    comments when nothing uses them.
+
+    The analysis follows the type of each value from the names that
+    templates are rendered with (headers, header, cls and symbols), through
+    attributes, loops, filters and set tags, and records which fields are
+    read on each kind of object. It's conservative:
+
+    - a field read from a value whose type isn't known (such as something a
+      hook stored in data, or a macro argument) is kept on every kind
+    - if an object is used as a whole (iterated over, looked up with a
+      name that isn't constant, or compared), all of its fields are kept
+    - if a parsed object may be turned into text or JSON, or passed to a
+      function that isn't a macro, or a template can't be found, nothing
+      is pruned
+    - a value whose type isn't known that's used as a whole or turned into
+      text may be any parsed object, so all of the fields of every kind
+      are kept
+'''
+
+from os.path import basename
+
+import jinja2
+from jinja2 import nodes
+
+_kinds = ('header', 'class', 'method', 'variable', 'enum')
+
+# kinds that are dicts, which would be empty (and false) if all of their
+# keys were removed
+_dict_kinds = ('class', 'method', 'variable', 'enum')
+
+_access = ('public', 'protected', 'private')
+
+_unknown = frozenset(['unknown'])
+_value = frozenset(['value'])
+_macro = frozenset(['macro'])
+
+
+def _of(atom):
+    return frozenset([('of', atom)])
+
+
+# the type of the fields of each kind that hold other parsed objects.
+# ('of', x) is a list or dict of x, and ('access', x) is a dict of lists of x
+# keyed by access specifier
+_fields = {
+    'header': {
+        'classes': _of('class'),
+        'all_classes': _of('class'),
+        'classes_order': _of('class'),
+        'functions': _of('method'),
+        'all_functions': _of('method'),
+        'enums': _of('enum'),
+        'all_enums': _of('enum'),
+        'global_enums': _of('enum'),
+        'all_global_enums': _of('enum'),
+        'variables': _of('variable'),
+        'all_variables': _of('variable'),
+        # FileContents have the same attributes as a header
+        'by_file': _of('header'),
+    },
+    'class': {
+        'methods': frozenset([('access', 'method')]),
+        'properties': frozenset([('access', 'variable')]),
+        'enums': frozenset([('access', 'enum')]),
+        'nested_classes': _of('class'),
+        'base_classes': _of('class'),
+        'derived_classes': _of('class'),
+        'ancestors': _of('class'),
+        'members': _of('variable'),
+        'parent': frozenset(['class']),
+    },
+    'method': {
+        'parameters': _of('variable'),
+        'parent': frozenset(['class']),
+        'class': frozenset(['class']),
+    },
+    'variable': {
+        'parent': frozenset(['class', 'method']),
+        'method': frozenset(['method']),
+        'class': frozenset(['class']),
+    },
+    'enum': {},
+    'symbols': {
+        'classes': _of('class'),
+        'enums': _of('enum'),
+        'functions': frozenset([('of', ('of', 'method'))]),
+        'headers': _of('header'),
+        'find_class': frozenset([('returns', 'class')]),
+    },
+}
+
+# filters that return their argument (or some of its items) in a list
+_list_filters = frozenset(['list', 'sort', 'reverse', 'unique', 'select', 'reject',
+                           'selectattr', 'rejectattr'])
+
+# filters that serialize the whole of their argument
+_dump_filters = frozenset(['tojson', 'pprint', 'xmlattr'])
+
+# filters that look at the size of their argument
+_size_filters = frozenset(['length', 'count'])
+
+# globals that can be called with anything. What they return (such as a
+# namespace or dict) may hold what was passed to them.
+_builtin_globals = ('range', 'dict', 'namespace', 'joiner', 'cycler', 'lipsum',
+                    'skip_generation')
+
+
+class _GiveUp(Exception):
+    pass
+
+
+def _contains(atom, names):
+    # whether atom is (or is a container of) one of names
+    while isinstance(atom, tuple):
+        atom = atom[1]
+    return atom in names
+
+
+class TemplateUsage:
+    '''The fields of each kind of parsed object that templates can use'''
+
+    def __init__(self):
+        #: Names of the fields read from each kind
+        self.read = {k: set() for k in _kinds}
+        #: Kinds whose fields are all used
+        self.full = set()
+
+    def reads(self, name, kinds=_kinds):
+        '''True if a field called name may be used on any of kinds'''
+        return any(k in self.full or name in self.read[k] for k in kinds)
+
+    def fields(self):
+        '''Returns the fields to keep, in the form used by the fields option'''
+        fields = {}
+        for kind in _kinds:
+            if kind not in self.full:
+                keep = set(self.read[kind])
+                if kind in _dict_kinds:
+                    keep.add('name')
+                fields[kind] = sorted(keep)
+        return fields
+
+
+def analyze_templates(env, cfg):
+    '''
+        Analyzes the templates (and output filenames) in cfg, loaded from
+        the jinja2 Environment env. Returns a :class:`TemplateUsage`, or None
+        if what they use can't be worked out.
+    '''
+    analyzer = _Analyzer(env, cfg)
+    try:
+        for tmpl in cfg.templates:
+            analyzer.template(tmpl, False)
+        for tmpl in cfg.class_templates:
+            analyzer.template(tmpl, True)
+    except (_GiveUp, jinja2.TemplateError):
+        return None
+
+    return analyzer.usage
+
+
+class _Analyzer:
+    def __init__(self, env, cfg):
+        self.env = env
+        self.cfg = cfg
+        self.usage = TemplateUsage()
+        self.loading = []
+
+    def template(self, tmpl, is_class):
+        # vars and the config don't contain parsed objects
+        scope = {name: _value for name in self.cfg.vars}
+        scope['config'] = scope['per_tmpl_vars'] = _value
+        for name in _builtin_globals:
+            scope[name] = frozenset(['builtin'])
+
+        scope['headers'] = _of('header')
+        scope['header'] = frozenset(['header'])
+        scope['symbols'] = frozenset(['symbols'])
+        scope['self'] = frozenset(['module'])
+        if is_class:
+            scope['cls'] = frozenset(['class'])
+
+        self.globals = scope
+        self.load(basename(tmpl.src), dict(scope))
+
+        if tmpl.dst and '{' in tmpl.dst:
+            self.body(self.env.parse(tmpl.dst).body, dict(scope))
+
+    def load(self, name, scope):
+        if name in self.loading:
+            return
+        self.loading.append(name)
+        try:
+            source, _, _ = self.env.loader.get_source(self.env, name)
+            self.body(self.env.parse(source, name).body, scope)
+        finally:
+            self.loading.pop()
+
+    #
+    # What's done with values
+    #
+
+    def read(self, t, attr):
+        '''Returns the type of t.attr (or t['attr'])'''
+        result = set()
+        for atom in t:
+            if atom in _kinds:
+                self.usage.read[atom].add(attr)
+                result |= _fields[atom].get(attr, _unknown)
+            elif atom == 'symbols':
+                result |= _fields['symbols'].get(attr, _unknown)
+            elif atom == 'unknown':
+                for kind in _kinds:
+                    self.usage.read[kind].add(attr)
+                result |= _unknown
+            elif atom == 'module':
+                result |= _macro
+            elif isinstance(atom, tuple) and atom[0] == 'of':
+                # jinja2 looks up missing attributes of a dict as keys
+                result.add(atom[1])
+            elif isinstance(atom, tuple) and atom[0] == 'access':
+                result |= _of(atom[1]) if attr in _access else _unknown
+            elif isinstance(atom, tuple) and atom[0] == 'group':
+                result |= _of(atom[1]) if attr == 'list' else _value
+            else:
+                result |= _value
+        return frozenset(result)
+
+    def whole(self, t):
+        '''t is used as a whole, so all of its keys are needed'''
+        for atom in t:
+            if atom in _kinds:
+                self.usage.full.add(atom)
+            elif atom == 'unknown':
+                # it may be any kind of parsed object
+                self.usage.full.update(_kinds)
+
+    def text(self, t):
+        '''t is turned into text, which shows every key of a parsed object'''
+        if any(_contains(atom, ('symbols',) + _kinds) for atom in t):
+            raise _GiveUp()
+        self.whole(t)
+
+    def dump(self, t):
+        '''t is serialized, including whatever it refers to'''
+        if any(_contains(atom, ('symbols', 'unknown') + _kinds) for atom in t):
+            raise _GiveUp()
+
+    def items(self, t):
+        '''Returns the type of the items in t when iterating over it'''
+        result = set()
+        for atom in t:
+            if isinstance(atom, tuple):
+                if atom[0] == 'of':
+                    result.add(atom[1])
+                elif atom[0] == 'pairs':
+                    result.add(('pair', atom[1]))
+                elif atom[0] == 'groups':
+                    result.add(('group', atom[1]))
+                else:
+                    result.add('value')
+            elif atom in _kinds:
+                # the keys
+                self.usage.full.add(atom)
+                result.add('value')
+            elif atom == 'unknown':
+                # the keys, if it's a parsed object
+                self.whole(_unknown)
+                result.add('unknown')
+            else:
+                result.add('value')
+        return frozenset(result)
+
+    def lookup(self, t, key):
+        '''Returns the type of t[key], where key isn't a constant'''
+        result = set()
+        for atom in t:
+            if atom in _kinds:
+                self.usage.full.add(atom)
+                result.add('unknown')
+            elif isinstance(atom, tuple) and atom[0] == 'of':
+                result.add(atom[1])
+            elif isinstance(atom, tuple) and atom[0] == 'access':
+                result.add(('of', atom[1]))
+            elif atom == 'value':
+                result.add('value')
+            else:
+                self.whole(frozenset([atom]))
+                result.add('unknown')
+        return frozenset(result)
+
+    def attribute(self, t, attr):
+        # for the attribute='a.b' argument of filters
+        for part in attr.split('.'):
+            t = self.lookup(t, part) if part.isdigit() else self.read(t, part)
+        return t
+
+    #
+    # Statements
+    #
+
+    def body(self, body, scope):
+        for node in body:
+            self.stmt(node, scope)
+
+    def bind(self, scope, target, t, replace=False):
+        # a name that is set more than once (such as in an if block) may
+        # have either type
+        if isinstance(target, nodes.Name):
+            if not replace:
+                t |= scope.get(target.name, frozenset())
+            scope[target.name] = t
+        elif isinstance(target, nodes.Tuple):
+            first = second = _unknown
+            if len(target.items) == 2:
+                pairs = [a[1] for a in t if isinstance(a, tuple) and a[0] in ('pair', 'group')]
+                if pairs and len(pairs) == len(t):
+                    first = _value
+                    second = frozenset()
+                    for atom in t:
+                        second |= frozenset([atom[1]]) if atom[0] == 'pair' else _of(atom[1])
+            for i, item in enumerate(target.items):
+                self.bind(scope, item, second if i == 1 else first, replace)
+
+    def stmt(self, node, scope):
+        if isinstance(node, nodes.Output):
+            for child in node.nodes:
+                if not isinstance(child, nodes.TemplateData):
+                    self.text(self.expr(child, scope))
+
+        elif isinstance(node, nodes.For):
+            items = self.items(self.expr(node.iter, scope))
+            inner = dict(scope)
+            inner['loop'] = _macro
+            if node.recursive:
+                items = _unknown
+            self.bind(inner, node.target, items, True)
+            if node.test is not None:
+                self.expr(node.test, inner)
+            self.body(node.body, inner)
+            self.body(node.else_, dict(scope))
+
+        elif isinstance(node, nodes.If):
+            self.expr(node.test, scope)
+            self.body(node.body, scope)
+            for elif_ in node.elif_:
+                self.stmt(elif_, scope)
+            self.body(node.else_, scope)
+
+        elif isinstance(node, nodes.Macro):
+            scope[node.name] = _macro
+            self.macro(node, scope)
+
+        elif isinstance(node, nodes.CallBlock):
+            self.expr(node.call, scope)
+            self.macro(node, scope)
+
+        elif isinstance(node, nodes.FilterBlock):
+            self.body(node.body, scope)
+            self.filter(node.filter, None, scope)
+
+        elif isinstance(node, nodes.With):
+            inner = dict(scope)
+            for target, value in zip(node.targets, node.values):
+                self.bind(inner, target, self.expr(value, scope), True)
+            self.body(node.body, inner)
+
+        elif isinstance(node, nodes.Assign):
+            t = self.expr(node.node, scope)
+            if not isinstance(node.target, nodes.NSRef):
+                self.bind(scope, node.target, t)
+
+        elif isinstance(node, nodes.AssignBlock):
+            self.body(node.body, scope)
+            if node.filter is not None:
+                self.filter(node.filter, None, scope)
+            self.bind(scope, node.target, _value)
+
+        elif isinstance(node, nodes.Block):
+            if node.scoped:
+                self.body(node.body, scope)
+            else:
+                # blocks only see the context, not the variables around them
+                self.body(node.body, dict(self.globals))
+
+        elif isinstance(node, (nodes.Include, nodes.Extends)):
+            self.load(self.name(node.template), dict(scope))
+
+        elif isinstance(node, nodes.Import):
+            self.load(self.name(node.template), dict(self.globals))
+            scope[node.target] = frozenset(['module'])
+
+        elif isinstance(node, nodes.FromImport):
+            self.load(self.name(node.template), dict(self.globals))
+            for name in node.names:
+                scope[name[1] if isinstance(name, tuple) else name] = _macro
+
+        elif isinstance(node, nodes.ExprStmt):
+            self.expr(node.node, scope)
+
+        else:
+            for child in node.iter_child_nodes():
+                if isinstance(child, nodes.Expr):
+                    self.expr(child, scope)
+                else:
+                    self.stmt(child, scope)
+
+    def macro(self, node, scope):
+        # what is passed to a macro isn't followed, so its arguments are
+        # of unknown type
+        for default in node.defaults:
+            self.expr(default, scope)
+        inner = dict(scope)
+        for name in ('varargs', 'kwargs'):
+            inner[name] = _unknown
+        inner['caller'] = _macro
+        for arg in node.args:
+            inner[arg.name] = _unknown
+        self.body(node.body, inner)
+
+    def name(self, node):
+        # the name of a template that's included, imported or extended
+        if isinstance(node, nodes.Const) and isinstance(node.value, str):
+            return node.value
+        raise _GiveUp()
+
+    #
+    # Expressions
+    #
+
+    def expr(self, node, scope):
+        if isinstance(node, nodes.Name):
+            return scope.get(node.name, _unknown)
+
+        elif isinstance(node, nodes.Const):
+            return _value
+
+        elif isinstance(node, nodes.Getattr):
+            return self.read(self.expr(node.node, scope), node.attr)
+
+        elif isinstance(node, nodes.Getitem):
+            t = self.expr(node.node, scope)
+            arg = node.arg
+            if isinstance(arg, nodes.Const) and isinstance(arg.value, str):
+                return self.read(t, arg.value)
+            elif isinstance(arg, nodes.Slice):
+                self.expr(arg, scope)
+                return t
+            self.expr(arg, scope)
+            return self.lookup(t, arg)
+
+        elif isinstance(node, nodes.Filter):
+            return self.filter(node, self.expr(node.node, scope), scope)
+
+        elif isinstance(node, nodes.Test):
+            self.expr(node.node, scope)
+            self.args(node, scope)
+            return _value
+
+        elif isinstance(node, nodes.Call):
+            return self.call(node, scope)
+
+        elif isinstance(node, (nodes.List, nodes.Tuple)):
+            t = frozenset()
+            for item in node.items:
+                t |= self.expr(item, scope)
+            return frozenset(('of', atom) for atom in t)
+
+        elif isinstance(node, nodes.CondExpr):
+            self.expr(node.test, scope)
+            t = self.expr(node.expr1, scope)
+            if node.expr2 is not None:
+                t |= self.expr(node.expr2, scope)
+            return t
+
+        elif isinstance(node, (nodes.And, nodes.Or, nodes.Add)):
+            return self.expr(node.left, scope) | self.expr(node.right, scope)
+
+        elif isinstance(node, nodes.Concat):
+            for child in node.nodes:
+                self.text(self.expr(child, scope))
+            return _value
+
+        elif isinstance(node, nodes.Compare):
+            self.compare(node, scope)
+            return _value
+
+        elif isinstance(node, nodes.Dict):
+            for pair in node.items:
+                self.expr(pair.key, scope)
+                self.expr(pair.value, scope)
+            return _unknown
+
+        else:
+            for child in node.iter_child_nodes():
+                self.expr(child, scope)
+            return _value if isinstance(node, (nodes.BinExpr, nodes.UnaryExpr)) else _unknown
+
+    def compare(self, node, scope):
+        left_node = node.expr
+        left = self.expr(left_node, scope)
+        for op in node.ops:
+            right = self.expr(op.expr, scope)
+            if op.op in ('in', 'notin'):
+                if isinstance(left_node, nodes.Const) and isinstance(left_node.value, str):
+                    # 'doxygen' in fn
+                    self.read(right, left_node.value)
+                else:
+                    self.whole(right)
+                    if left & _value != left:
+                        self.whole(self.items(right))
+            elif not isinstance(left_node, nodes.Const) and not isinstance(op.expr, nodes.Const):
+                # comparing dicts compares all of their keys
+                for t in (left, right):
+                    self.whole(t)
+                    self.whole(self.items(t - frozenset(_kinds)))
+            left_node, left = op.expr, right
+
+    def args(self, node, scope):
+        types = [self.expr(arg, scope) for arg in node.args]
+        for kwarg in node.kwargs:
+            types.append(self.expr(kwarg.value, scope))
+        for dyn in (node.dyn_args, node.dyn_kwargs):
+            if dyn is not None:
+                types.append(self.expr(dyn, scope))
+        return types
+
+    def call(self, node, scope):
+        fn = node.node
+
+        # dict methods
+        if isinstance(fn, nodes.Getattr) and fn.attr in ('get', 'items', 'keys', 'values'):
+            t = self.expr(fn.node, scope)
+            self.args(node, scope)
+            if fn.attr == 'get' and node.args and isinstance(node.args[0], nodes.Const):
+                key = node.args[0].value
+                if isinstance(key, str):
+                    return self.read(t, key)
+            result = set()
+            for atom in t:
+                if atom in _kinds:
+                    self.usage.full.add(atom)
+                    result.add('unknown')
+                elif isinstance(atom, tuple) and atom[0] in ('of', 'access'):
+                    elem = atom[1] if atom[0] == 'of' else ('of', atom[1])
+                    if fn.attr == 'get':
+                        result.add(elem)
+                    elif fn.attr == 'values':
+                        result.add(('of', elem))
+                    elif fn.attr == 'items':
+                        result.add(('pairs', elem))
+                    else:
+                        result.add(('of', 'value'))
+                else:
+                    self.whole(frozenset([atom]))
+                    result.add('unknown')
+            return frozenset(result)
+
+        callee = self.expr(fn, scope)
+        types = self.args(node, scope)
+
+        result = set()
+        for atom in callee:
+            if atom == 'macro':
+                result.add('value')
+            elif atom == 'builtin':
+                result.add('unknown')
+            elif isinstance(atom, tuple) and atom[0] == 'returns':
+                result.add(atom[1])
+            else:
+                # a python function could look at anything it's given
+                for t in types:
+                    self.text(t)
+                result.add('unknown')
+        return frozenset(result)
+
+    def filter(self, node, t, scope):
+        name = node.name
+
+        def _const(i, kw):
+            # the value of a constant argument (by position or keyword)
+            arg = node.args[i] if i is not None and len(node.args) > i else None
+            for kwarg in node.kwargs:
+                if kwarg.key == kw:
+                    arg = kwarg.value
+            if arg is None:
+                return None
+            if isinstance(arg, nodes.Const) and isinstance(arg.value, str):
+                return arg.value
+            raise _GiveUp()
+
+        types = self.args(node, scope)
+        if t is None:
+            # a filter block filters text
+            t = _value
+
+        if name == 'map':
+            attr = _const(None, 'attribute')
+            if attr is not None:
+                mapped = self.attribute(self.items(t), attr)
+            else:
+                # map('filter', ...)
+                inner = nodes.Filter(None, _const(0, None), node.args[1:], node.kwargs,
+                                     node.dyn_args, node.dyn_kwargs)
+                mapped = self.filter(inner, self.items(t), scope)
+            return frozenset(('of', atom) for atom in mapped)
+
+        attr = None
+        if name in ('selectattr', 'rejectattr', 'groupby', 'sum'):
+            attr = _const(0, 'attribute')
+        elif name in ('sort', 'unique', 'min', 'max', 'join'):
+            attr = _const(None, 'attribute')
+        elif name == 'attr':
+            try:
+                return self.read(t, _const(0, 'name'))
+            except _GiveUp:
+                return self.lookup(t, None)
+
+        items = self.items(t)
+        if attr is not None:
+            self.attribute(items, attr)
+
+        if name in ('default', 'd'):
+            return t | (types[0] if types else _value)
+        elif name in ('first', 'last', 'random', 'min', 'max'):
+            return items
+        elif name in _list_filters:
+            return frozenset(('of', atom) for atom in items)
+        elif name in ('batch', 'slice'):
+            return frozenset(('of', ('of', atom)) for atom in items)
+        elif name == 'groupby':
+            return frozenset(('groups', atom) for atom in items)
+        elif name in ('dictsort', 'items'):
+            result = set()
+            for atom in t:
+                if isinstance(atom, tuple) and atom[0] == 'of':
+                    result.add(('pairs', atom[1]))
+                elif isinstance(atom, tuple) and atom[0] == 'access':
+                    result.add(('pairs', ('of', atom[1])))
+                else:
+                    self.whole(frozenset([atom]))
+                    result.add(('pairs', 'unknown'))
+            return frozenset(result)
+        elif name in _size_filters:
+            self.whole(t)
+            return _value
+        elif name == 'sum':
+            return _value
+        elif name == 'join':
+            if attr is None:
+                self.text(items)
+            return _value
+        elif name in _dump_filters:
+            self.dump(t)
+            return _value
+
+        # the rest of the builtin filters work on text
+        self.text(t)
+        for arg in types:
+            self.text(arg)
+        return _value
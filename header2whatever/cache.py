@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+from os.path import abspath, exists, join
+
+from .util import write_atomic
+
+# Bump this whenever a change to the preprocessor alters its output
+_CACHE_VERSION = 3
+
+# Number of dependency sets remembered for a single header/option set
+_MAX_MANIFEST_ENTRIES = 8
+
+
+def hash_file(fname):
+    with open(fname, 'rb') as fp:
+        return hashlib.sha1(fp.read()).hexdigest()
+
+
+class PreprocessCache:
+    '''
+        On-disk cache of preprocessed output.
+
+        The output of the preprocessor depends on the header being processed,
+        the options it was processed with, and the contents of every file that
+        was actually included. The first two are known up front and select a
+        manifest; the manifest lists the dependency sets seen previously, each
+        with the content hashes of the files and the output they produced. An
+        entry is only used if every one of its files still has the same hash.
+
+        Outputs and manifests are evicted least recently used first once the
+        cache grows past max_size bytes.
+    '''
+
+    def __init__(self, path, max_size=256 * 1024 * 1024):
+        self.path = path
+        self.max_size = max_size
+        self.manifest_dir = join(path, 'manifests')
+        self.output_dir = join(path, 'outputs')
+
+        for d in (self.manifest_dir, self.output_dir):
+            if not exists(d):
+                os.makedirs(d, exist_ok=True)
+
+    def _manifest_fname(self, fname, options):
+        key = json.dumps([_CACHE_VERSION, abspath(fname), os.getcwd(), options])
+        return join(self.manifest_dir, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json')
+
+    def _load_manifest(self, mname):
+        try:
+            with open(mname, encoding='utf-8') as fp:
+                return json.load(fp)
+        except (OSError, ValueError):
+            return []
+
+    def get(self, fname, options):
+        '''
+            Returns the cached output for fname preprocessed with options, or
+            None if there isn't one that matches the current file contents
+        '''
+        mname = self._manifest_fname(fname, options)
+        hashes = {}
+
+        for entry in self._load_manifest(mname):
+            for dep, digest in entry['deps'].items():
+                if dep not in hashes:
+                    try:
+                        hashes[dep] = hash_file(dep)
+                    except OSError:
+                        hashes[dep] = None
+                if hashes[dep] != digest:
+                    break
+            else:
+                oname = join(self.output_dir, entry['output'])
+                try:
+                    with open(oname, encoding='utf-8') as fp:
+                        contents = fp.read()
+                except OSError:
+                    continue
+
+                # mark as recently used
+                os.utime(mname)
+                os.utime(oname)
+                return contents
+
+        return None
+
+    def put(self, fname, options, deps, contents):
+        '''
+            Stores the output of preprocessing fname with options, which read
+            the files listed in deps
+        '''
+        mname = self._manifest_fname(fname, options)
+
+        try:
+            dep_hashes = {dep: hash_file(dep) for dep in sorted(set(deps))}
+        except OSError:
+            # a dependency disappeared while we were running, don't cache it
+            return
+
+        output = hashlib.sha1(contents.encode('utf-8')).hexdigest() + '.txt'
+        oname = join(self.output_dir, output)
+        if exists(oname):
+            os.utime(oname)
+        else:
+            write_atomic(oname, contents)
+
+        entries = [e for e in self._load_manifest(mname) if e['deps'] != dep_hashes]
+        entries.insert(0, {'deps': dep_hashes, 'output': output})
+        write_atomic(mname, json.dumps(entries[:_MAX_MANIFEST_ENTRIES]))
+
+        self.evict()
+
+    def evict(self):
+        '''Removes least recently used files until the cache fits in max_size'''
+        files = []
+        total = 0
+        for d in (self.manifest_dir, self.output_dir):
+            for n in os.listdir(d):
+                fn = join(d, n)
+                try:
+                    st = os.stat(fn)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, fn))
+                total += st.st_size
+
+        if total <= self.max_size:
+            return
+
+        files.sort()
+        for _, size, fn in files:
+            if total <= self.max_size:
+                break
+            try:
+                os.unlink(fn)
+            except OSError:
+                pass
+            total -= size
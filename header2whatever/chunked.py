@@ -0,0 +1,325 @@
+'''
+    Parses a single large header in parallel.
+
+    The text is split at line boundaries between top level declarations
+    (top level meaning that only namespace and extern "C" blocks are open).
+    Each chunk is parsed in a worker process with the namespaces it is in
+    reopened on the same line as the chunk starts, and with newlines or a
+    #line directive in front of it so that line numbers don't change.
+
+    CppHeaderParser resolves types in finalize() once the whole header has
+    been read, so the workers skip that step. The chunks are merged and then
+    finalized together, which gives the same result as parsing the header
+    in one go. Some state carries over from one part of a header to the
+    next while parsing: the counters used to name anonymous classes, the
+    names of the classes seen so far and the current access specifier.
+    These are predicted from the text of the previous chunks, and if the
+    anonymous class counts turn out to be wrong the header is parsed again
+    in a single process.
+'''
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.reduction import ForkingPickler
+import re
+
+import CppHeaderParser
+from CppHeaderParser.CppHeaderParser import CppVariable, Resolver, TagStr
+
+from .scan import strip_template, token_re
+
+_line_re = re.compile(r'^[ \t]*#line (\d+) "(.*)"')
+
+_access = ('public', 'protected', 'private')
+_anon_kinds = ('struct', 'union', 'class')
+
+# finalize() needs these, but CppHeader deletes them once it's done
+_finalize_attrs = ('_forward_decls', '_template_typenames', '_precomp_macro_buf', 'typedefs_order')
+
+
+class _Chunk:
+    def __init__(self, start, line, openers, line_directive, access):
+        self.start = start
+        self.end = None
+        self.line = line
+        self.openers = openers
+        self.closers = 0
+        self.line_directive = line_directive
+        self.access = access
+        self.anon = {k: 0 for k in _anon_kinds}
+        self.class_names = []
+
+
+def split_header(contents, chunk_lines):
+    '''
+        Returns a list of chunks of roughly chunk_lines lines each, or None
+        if the header can't be split (it doesn't have balanced braces)
+    '''
+    chunks = [_Chunk(0, 1, [], None, 'private')]
+    cur = chunks[0]
+
+    # ('ns', opener) for namespaces, ('type', None) for enums and
+    # initializers and ('class', access) for classes, which need a ; after
+    # the }, and ('body', None) otherwise
+    stack = []
+    parens = 0
+    stmt = []
+    boundary = line_start = True
+    pending = None
+    line = 1
+    line_directive = None
+
+    # CppHeaderParser doesn't reset the access specifier after a top level
+    # class, and uses it for the aliases that come after it
+    access = 'private'
+
+    for m in token_re.finditer(contents):
+        kind = m.lastgroup
+        if kind == 'skip':
+            continue
+        elif kind == 'comment':
+            # a comment on a line of its own (such as the doxygen for a
+            # declaration) goes with what comes after it
+            if line_start:
+                boundary = False
+            line += m.group().count('\n')
+            continue
+        elif kind == 'nl':
+            line += 1
+            line_start = True
+            if boundary and pending is None and line - cur.line >= chunk_lines and \
+               all(k == 'ns' for k, _ in stack):
+                pending = _Chunk(m.end(), line, [o for _, o in stack], line_directive, access)
+            continue
+        elif kind == 'pp':
+            lm = _line_re.match(m.group())
+            if lm:
+                line_directive = (int(lm.group(1)), lm.group(2), line)
+            line += m.group().count('\n')
+            continue
+
+        tok = m.group()
+        boundary = line_start = False
+
+        # CppHeaderParser loses the declaration after an empty namespace, so
+        # a chunk can't start with the } of the namespaces it reopens
+        if pending is not None:
+            if tok != '}':
+                cur.end = pending.start
+                cur.closers = len(pending.openers)
+                cur = pending
+                chunks.append(cur)
+            pending = None
+
+        if tok == '(' or tok == '[':
+            parens += 1
+        elif tok == ')' or tok == ']':
+            parens -= 1
+        elif parens:
+            stmt.append(tok)
+        elif tok == ';':
+            stmt = []
+            boundary = not stack or stack[-1][0] == 'ns'
+        elif tok == ':' and len(stmt) == 1 and stmt[0] in _access:
+            access = stmt[0]
+            stmt = []
+        elif tok == '{':
+            words = [t for t in stmt if t != 'typedef']
+            if words and (words[0] == 'namespace' or words[:2] == ['inline', 'namespace']
+                          or (words[0] == 'extern' and len(words) == 2 and words[1].startswith('"'))):
+                stack.append(('ns', ' '.join(stmt + ['{'])))
+                boundary = True
+            else:
+                words = strip_template(words)
+                kinds = [i for i, t in enumerate(words) if t in _anon_kinds]
+                if any(k not in ('ns', 'class') for k, _ in stack):
+                    # CppHeaderParser skips over function bodies
+                    stack.append(('body', None))
+                elif 'enum' in words or '=' in words:
+                    stack.append(('type', None))
+                elif kinds:
+                    kind = words[kinds[0]]
+                    nested = any(k == 'class' for k, _ in stack)
+                    stack.append(('class', access if nested else None))
+                    access = 'private' if kind == 'class' else 'public'
+                    if words == [kind]:
+                        cur.anon[kind] += 1
+                    elif kinds[0] + 1 < len(words) and not nested:
+                        cur.class_names.append(words[kinds[0] + 1])
+                else:
+                    stack.append(('body', None))
+            stmt = []
+        elif tok == '}':
+            if not stack:
+                return None
+            kind, outer = stack.pop()
+            if kind == 'class' and outer:
+                access = outer
+            # CppHeaderParser keeps a } that closes a namespace in the debug
+            # text of the next declaration, so don't split until after that
+            boundary = False
+            stmt = []
+        else:
+            stmt.append(tok)
+
+    if stack or parens:
+        return None
+
+    cur.end = len(contents)
+    return chunks
+
+
+def _chunk_text(contents, chunk):
+    if chunk.line_directive:
+        n, fname, dline = chunk.line_directive
+        prefix = '#line %d "%s"\n' % (n + chunk.line - dline - 1, fname)
+    else:
+        prefix = '\n' * (chunk.line - 1)
+
+    if chunk.openers:
+        prefix += ' '.join(chunk.openers) + ' '
+
+    text = prefix + contents[chunk.start:chunk.end]
+    if chunk.closers:
+        text += '\n' + ' }' * chunk.closers
+    return text
+
+
+class _ChunkHeader(CppHeaderParser.CppHeader):
+    '''Parses a chunk, leaving finalize() to be done after merging'''
+
+    def __init__(self, text, access, anon, class_names):
+        self._access = access
+        self._anon_offsets = anon
+        self._seeded = {}
+        self._class_names = class_names
+        super().__init__(text, argType='string', preprocessed=True)
+
+    def initextra(self):
+        super().initextra()
+        self.curAccessSpecifier = self._access
+
+        # Resolver.CLASSES has been reset by now. Make the classes from
+        # previous chunks visible to the checks done while parsing
+        for name in self._class_names:
+            if name not in Resolver.CLASSES:
+                self._seeded[name] = Resolver.CLASSES[name] = {'name': name}
+
+    def finalize(self):
+        for name, placeholder in self._seeded.items():
+            if self.classes.get(name) is placeholder:
+                del self.classes[name]
+
+        self._chunk_vars = list(CppVariable.Vars)
+        self._chunk_anon = {k: getattr(self, 'anon_%s_counter' % k) for k in _anon_kinds}
+        for attr in _finalize_attrs:
+            setattr(self, '_chunk_' + attr.lstrip('_'), getattr(self, attr))
+
+        self._seeded = self._class_names = None
+
+
+def _anon_counter(kind):
+    # Starts the anonymous class counters from where the previous chunks
+    # left off, as the names they generate must be unique
+    attr = 'anon_%s_counter' % kind
+
+    def _get(self):
+        return self.__dict__[attr]
+
+    def _set(self, value):
+        if attr not in self.__dict__:
+            value += self._anon_offsets[kind]
+        self.__dict__[attr] = value
+
+    return property(_get, _set)
+
+for _kind in _anon_kinds:
+    setattr(_ChunkHeader, 'anon_%s_counter' % _kind, _anon_counter(_kind))
+
+
+def _tag_str(s, location):
+    return TagStr(s, location=location)
+
+# TagStr requires a location, which the default pickling doesn't pass
+ForkingPickler.register(TagStr, lambda s: (_tag_str, (str(s), s.location)))
+
+
+def _parse_chunk(text, access, anon, class_names):
+    return _ChunkHeader(text, access, anon, class_names)
+
+
+def _merge(parts):
+    header = CppHeaderParser.CppHeader('', argType='string', preprocessed=True)
+
+    # finalize() works on the global list of variables created while parsing
+    CppVariable.Vars = []
+
+    for attr in _finalize_attrs:
+        setattr(header, attr, [] if attr != '_forward_decls' else {})
+
+    for part in parts:
+        header.classes.update(part.classes)
+        for attr in ('classes_order', 'functions', 'enums', 'variables', 'extern_templates',
+                     'pragmas', 'pragmas_detail', 'defines', 'defines_detail',
+                     'includes', 'includes_detail'):
+            getattr(header, attr).extend(getattr(part, attr))
+
+        header.global_enums.update(part.global_enums)
+        header.typedefs.update(part.typedefs)
+        header.using.update(part.using)
+
+        for fname in part.headerFileNames:
+            if fname not in header.headerFileNames:
+                header.headerFileNames.append(fname)
+
+        # this is the same list in every CppHeader
+        for ns in part.namespaces:
+            if ns not in header.namespaces:
+                header.namespaces.append(ns)
+
+        CppVariable.Vars.extend(part._chunk_vars)
+        header._forward_decls.update(part._chunk_forward_decls)
+        header._template_typenames.extend(part._chunk_template_typenames)
+        header._precomp_macro_buf.extend(part._chunk_precomp_macro_buf)
+        header.typedefs_order.extend(part._chunk_typedefs_order)
+
+    header.finalize()
+
+    for attr in _finalize_attrs:
+        del header.__dict__[attr]
+
+    return header
+
+
+def parse_chunked(contents, workers, chunk_lines=5000):
+    '''
+        Parses contents with CppHeaderParser using workers processes. If it
+        has fewer than 2 * chunk_lines lines or can't be split, it's parsed
+        in this process.
+    '''
+    chunks = None
+    if contents.count('\n') >= 2 * chunk_lines:
+        chunks = split_header(contents, chunk_lines)
+
+    if not chunks or len(chunks) < 2:
+        return CppHeaderParser.CppHeader(contents, argType='string', preprocessed=True)
+
+    args = []
+    anon = {k: 0 for k in _anon_kinds}
+    class_names = []
+    for chunk in chunks:
+        args.append((_chunk_text(contents, chunk), chunk.access, dict(anon), list(class_names)))
+        for k in _anon_kinds:
+            anon[k] += chunk.anon[k]
+        class_names.extend(chunk.class_names)
+
+    with ProcessPoolExecutor(min(workers, len(chunks))) as executor:
+        parts = list(executor.map(_parse_chunk, *zip(*args)))
+
+    # Each chunk must have named its anonymous classes the way a single
+    # parse would have, or the names won't be unique
+    for (_, _, offsets, _), chunk, part in zip(args, chunks, parts):
+        for k in _anon_kinds:
+            if part._chunk_anon[k] != offsets[k] + chunk.anon[k]:
+                return CppHeaderParser.CppHeader(contents, argType='string', preprocessed=True)
+
+    return _merge(parts)
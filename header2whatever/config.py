@@ -1,6 +1,15 @@
 
 from schematics.models import Model
-from schematics.types import ModelType, BooleanType, StringType, ListType, DictType
+from schematics.types import ModelType, BooleanType, IntType, StringType, ListType, DictType
+
+
+class PreprocessType(BooleanType):
+    '''A boolean, or the string "auto"'''
+
+    def to_native(self, value, context=None):
+        if value == 'auto':
+            return value
+        return super().to_native(value, context)
 
 
 class Template(Model):
@@ -30,6 +39,12 @@ class Config(Model):
     # Jinja2 templates processed for each class
     class_templates = ListType(ModelType(Template), default=[])
 
+    #: If set, what each output of class_templates was rendered from is
+    #: recorded in this JSON file, and on later runs they're only rendered
+    #: again for the classes whose data, template or globals changed (see
+    #: :mod:`.incremental`). Files are only written if their contents changed
+    class_manifest = StringType()
+
     # Input custom hooks
     hooks = StringType()
 
@@ -39,12 +54,16 @@ class Config(Model):
     #: Variables to pass to the template
     vars = DictType(StringType, default={})
 
-    #: For macros or other nonsense, these will
-    #: be added to CppHeaderParser's ignore list
+    #: For macros or other nonsense, these will be ignored as if they were
+    #: in CppHeaderParser's ignore list. Entries ending with () also remove
+    #: their arguments.
     ignore_symbols = ListType(StringType)
 
-    #: Enable preprocessing of the file
-    preprocess = BooleanType(default=False)
+    #: Enable preprocessing of the file. If 'auto', headers are only
+    #: preprocessed if a quick scan finds directives other than an include
+    #: guard, #include or #pragma, or uses of macros from pp_defines or
+    #: from the files it includes
+    preprocess = PreprocessType(default=False)
 
     #: If True, don't modify preprocessed output and keep #line preprocessing
     #: tokens in the output. Otherwise, remove anything not associated with
@@ -58,4 +77,97 @@ class Config(Model):
     #: it might make sense to add '__cplusplus 201103L' here
     pp_defines = ListType(StringType, default=[])
 
-
+    #: Preprocessor to use: 'pcpp', or 'gcc'/'clang' to run the compiler's
+    #: preprocessor instead. pcpp is used if the compiler isn't installed.
+    #: The compiler inlines the system headers that pcpp can't find, but
+    #: they're still listed in includes, as they are with pcpp
+    pp_backend = StringType(default='pcpp', choices=['pcpp', 'gcc', 'clang'])
+
+    #: Which comments to keep in preprocessed output: 'all', 'doxygen' or
+    #: 'none'. 'doxygen' keeps the text of every ///, //!, /** and /*!
+    #: comment (wherever it is, not only next to declarations) and empties
+    #: the others, so the doxygen attached to declarations is the same as
+    #: with 'all'. Dropping comments saves parsing time.
+    pp_comments = StringType(default='all', choices=['all', 'doxygen', 'none'])
+
+    #: Number of threads pcpp uses to read included files before they are
+    #: needed. Useful on slow file systems; 0 disables prefetching
+    pp_prefetch_workers = IntType(default=0)
+
+    #: If set, statistics about the work pcpp did for each macro, #if
+    #: expression and file are written to this file as JSON
+    pp_stats = StringType()
+
+    #: Use the specialized pcpp tokenizer. Set to False to fall back to
+    #: the generic ply lexer
+    pp_fast_lexer = BooleanType(default=True)
+
+    #: If set, preprocessed output is cached in this directory and reused
+    #: until one of the files it was created from changes
+    pp_cache_dir = StringType()
+
+    #: Maximum size of the preprocessor cache in bytes. The least recently
+    #: used entries are removed when it grows past this
+    pp_cache_size = IntType(default=256 * 1024 * 1024)
+
+    #: If True, __DATE__ and __TIME__ are fixed so that preprocessed output
+    #: is the same on every run. They are set from pp_source_date_epoch, or
+    #: the SOURCE_DATE_EPOCH environment variable, or else the epoch itself
+    pp_reproducible = BooleanType(default=False)
+
+    #: Time in seconds since the epoch used for __DATE__ and __TIME__ when
+    #: pp_reproducible is set
+    pp_source_date_epoch = IntType()
+
+    #: Parser backend: 'cppheaderparser', or a python file or module that
+    #: defines parse(contents, cfg) (see :mod:`.parsers`)
+    parser = StringType(default='cppheaderparser')
+
+    #: If set, only the definitions of these classes are parsed. Entries are
+    #: names or fnmatch patterns, matched against the name of each top level
+    #: class and against its name qualified by namespace (ns::Name).
+    #: Typedefs, using and forward declarations are kept, but types that
+    #: refer to classes which weren't selected aren't resolved
+    only_classes = ListType(StringType)
+
+    #: If set, only the declarations in these namespaces (names or fnmatch
+    #: patterns, such as 'ns::detail'), and namespaces nested in them, are
+    #: parsed, plus any classes selected by only_classes
+    only_namespaces = ListType(StringType)
+
+    #: If True, the bodies of functions and methods defined in headers are
+    #: replaced with {} before parsing, which is faster for headers with a
+    #: lot of inline code
+    strip_function_bodies = BooleanType(default=False)
+
+    #: Number of processes used to parse a large header. If set, headers
+    #: with at least twice parse_chunk_lines lines are split between top
+    #: level declarations and the parts parsed in parallel
+    parse_workers = IntType(default=0)
+
+    #: Number of lines in each part of a header that is parsed in parallel
+    parse_chunk_lines = IntType(default=5000)
+
+    #: If True, equal strings in the parsed headers (types, names, access
+    #: specifiers, namespaces...) are replaced with a single shared copy
+    #: once all of the headers are parsed, which saves memory when there
+    #: are a lot of them
+    intern_strings = BooleanType(default=False)
+
+    #: If set, only these fields of the parsed headers are kept once the
+    #: hooks have run. Keys are the kind of object ('header', 'class',
+    #: 'method', 'variable' or 'enum'), and values list the attributes or
+    #: keys of those objects that templates use (see :mod:`.prune`)
+    fields = DictType(ListType(StringType))
+
+    #: If True, the templates are analyzed to find the fields of the parsed
+    #: headers that they can use, and the rest are removed once the hooks
+    #: have run (see :mod:`.analyze`). Ignored if fields is set. If there
+    #: are no hooks and no template reads doxygen comments, they aren't
+    #: collected.
+    analyze_templates = BooleanType(default=False)
+
+    #: If set, the time spent parsing each header and calling the hooks,
+    #: and the memory saved by intern_strings, are written to this file as
+    #: JSON
+    parse_stats = StringType()
@@ -22,6 +22,19 @@
       - enums
       - variables
       - global_enums
+    - by_file maps the name of each file (as used by #line directives) to
+      an object with classes, functions, enums, global_enums and variables
+      attributes containing the items declared in that file
+    - pp_deterministic is False if the preprocessed output uses macros such
+      as __DATE__ that differ between runs, which are listed in
+      pp_volatile_macros
+
+    All headers are parsed before any hooks are called. The data passed to
+    each hook (and to the templates) contains 'symbols', a
+    :class:`.SymbolIndex` of the classes, enums, typedefs and functions in
+    all of the headers keyed by their fully qualified name. Each class is
+    also given base_classes, derived_classes and ancestors lists that link
+    to the other class objects (see :meth:`.SymbolIndex.resolve_hierarchy`).
 '''
 
 
@@ -0,0 +1,149 @@
+'''
+    Dumps the parsed headers as JSON, as an alternative to rendering the
+    pprint template. The output is written as it is encoded rather than
+    built up in memory first.
+
+    Each CppHeaderParser object (class, method, enum...) is only written out
+    in full the first time it appears. After that (for example, a method's
+    link back to its class) it's written as {"$ref": "<type> <name>"}.
+'''
+
+import json
+
+_encode_str = json.encoder.encode_basestring
+
+
+def _describe(v):
+    name = v.get('name') if isinstance(v, dict) else None
+    if name is None:
+        name = getattr(v, 'fname', None)
+    if name is None:
+        return type(v).__name__
+    return '%s %s' % (type(v).__name__, name)
+
+
+class _Encoder:
+    def __init__(self):
+        self.seen = set()
+
+    def iterencode(self, v):
+        if v is None:
+            yield 'null'
+        elif v is True:
+            yield 'true'
+        elif v is False:
+            yield 'false'
+        elif isinstance(v, str):
+            yield _encode_str(v)
+        elif isinstance(v, (int, float)):
+            yield json.dumps(v)
+        elif isinstance(v, type):
+            yield _encode_str(v.__name__)
+        elif isinstance(v, dict):
+            if self._is_shared(v):
+                yield '{"$ref": %s}' % _encode_str(_describe(v))
+            else:
+                yield from self._iterencode_dict(v)
+        elif isinstance(v, (list, tuple, set, frozenset)):
+            yield from self._iterencode_list(v)
+        elif hasattr(v, '__dict__'):
+            if self._is_shared(v):
+                yield '{"$ref": %s}' % _encode_str(_describe(v))
+            else:
+                yield from self._iterencode_dict(vars(v))
+        else:
+            yield _encode_str(repr(v))
+
+    def _is_shared(self, v):
+        # only model objects are tracked, plain dicts are always written
+        if type(v) is dict:
+            return False
+        if id(v) in self.seen:
+            return True
+        self.seen.add(id(v))
+        return False
+
+    def _iterencode_dict(self, d):
+        yield '{'
+        first = True
+        for k, x in d.items():
+            if not first:
+                yield ', '
+            first = False
+            yield _encode_str(k if isinstance(k, str) else str(k))
+            yield ': '
+            yield from self.iterencode(x)
+        yield '}'
+
+    def _iterencode_list(self, l):
+        yield '['
+        first = True
+        for x in l:
+            if not first:
+                yield ', '
+            first = False
+            yield from self.iterencode(x)
+        yield ']'
+
+
+def _children(v, part):
+    if isinstance(v, dict):
+        if part == '*':
+            return list(v.values())
+        if part in v:
+            return [v[part]]
+        if not type(v) is dict and hasattr(v, part):
+            return [getattr(v, part)]
+        return []
+    elif isinstance(v, (list, tuple)):
+        if part == '*':
+            return list(v)
+        if part.lstrip('-').isdigit():
+            i = int(part)
+            return [v[i]] if -len(v) <= i < len(v) else []
+        # select the items with that name
+        return [x for x in v if isinstance(x, dict) and x.get('name') == part]
+    elif hasattr(v, '__dict__'):
+        if part == '*':
+            return list(vars(v).values())
+        if hasattr(v, part):
+            return [getattr(v, part)]
+    return []
+
+
+def select(headers, selector):
+    '''
+        Returns the values selected from each header by a dotted path such as
+        ``classes.Foo.methods.public``. Each part of the path is an attribute
+        or key, an index into a list, ``*`` for every item, or the name of the
+        items to select from a list.
+    '''
+    values = list(headers)
+    for part in selector.split('.'):
+        values = [c for v in values for c in _children(v, part)]
+    return values
+
+
+def dump_json(headers, fp, selector=None, lines=False):
+    '''
+        Writes the headers (or the values selected from them) to fp as a
+        JSON array, or if lines is True, one JSON value per line
+    '''
+    values = headers if selector is None else select(headers, selector)
+    encoder = _Encoder()
+    write = fp.write
+
+    if lines:
+        for v in values:
+            for chunk in encoder.iterencode(v):
+                write(chunk)
+            write('\n')
+    else:
+        write('[')
+        first = True
+        for v in values:
+            write('\n' if first else ',\n')
+            first = False
+            for chunk in encoder.iterencode(v):
+                write(chunk)
+        write('\n]\n')
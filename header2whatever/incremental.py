@@ -0,0 +1,354 @@
+'''
+    Renders class_templates again only for the classes that changed since
+    the last run, instead of for every class in every header.
+
+    Each output is recorded in a manifest (a JSON file) along with:
+
+    - a fingerprint of the class it was rendered for: a hash of the class's
+      data once the hooks have run (and unused fields were removed), and of
+      the data of the classes it refers to, such as its nested classes,
+      parent, and base and derived classes
+    - a hash of the source of the template and of the templates it
+      includes, imports or extends
+    - a hash of the other globals that those templates read, such as data,
+      config, vars and per_tmpl_vars. If they read headers, header or
+      symbols, this covers all of the parsed headers
+
+    An output is only rendered again if one of these changed or the file is
+    missing, and is only written if its contents changed.
+
+    Since classes refer to their base and derived classes, a change to one
+    class renders the classes in its hierarchy again too. Setting fields or
+    analyze_templates removes the links that templates don't use, so that
+    only the classes that could render differently are rendered again.
+'''
+
+import hashlib
+import json
+from os.path import basename, exists
+
+import jinja2
+from jinja2 import meta
+
+from .util import write_atomic
+
+# Bump this whenever a change to the fingerprints alters what they cover
+_MANIFEST_VERSION = 1
+
+_scalars = (str, int, float, type(None))
+
+# the exact types of most scalars, which are checked for first
+_scalar_types = frozenset((str, int, float, bool, type(None)))
+
+# globals that hold the parsed headers
+_model_globals = ('headers', 'header', 'symbols')
+
+
+class _Hasher:
+    '''
+        Hashes values from the model. The classes in classes are hashed on
+        their own, and values that refer to them are hashed along with them
+    '''
+
+    def __init__(self, classes):
+        self.classes = {id(c): c for c in classes}
+        self.own = {}
+        self.groups = {}
+        self.digests = {}
+
+    def _own(self, root):
+        # the hash of root's own data, and the classes it refers to
+        result = self.own.get(id(root))
+        if result is None:
+            result = self._walk(root)
+            if id(root) in self.classes:
+                self.own[id(root)] = result
+        return result
+
+    def _walk(self, root):
+        parts = []
+        deps = []
+        dep_index = {}
+        seen = {}
+        classes = self.classes
+
+        def walk(v):
+            if isinstance(v, _scalars):
+                parts.append(repr(v))
+                return
+
+            key = id(v)
+            if key in classes and v is not root:
+                if key not in dep_index:
+                    dep_index[key] = len(deps)
+                    deps.append(v)
+                parts.append('<class %d>' % dep_index[key])
+                return
+
+            # shared objects (and the links back to them) are only hashed once
+            if key in seen:
+                parts.append('<ref %d>' % seen[key])
+                return
+            seen[key] = len(seen)
+
+            if isinstance(v, dict):
+                parts.append('{' + type(v).__name__)
+                for k, x in v.items():
+                    parts.append(repr(k))
+                    if type(x) in _scalar_types:
+                        parts.append(repr(x))
+                    else:
+                        walk(x)
+                # h2w adds the class hierarchy as attributes
+                if type(v) is not dict and hasattr(v, '__dict__'):
+                    walk(vars(v))
+                parts.append('}')
+            elif isinstance(v, (list, tuple)):
+                parts.append('[')
+                for x in v:
+                    if type(x) in _scalar_types:
+                        parts.append(repr(x))
+                    else:
+                        walk(x)
+                parts.append(']')
+            elif isinstance(v, (set, frozenset)):
+                parts.append('(')
+                for x in sorted(v, key=repr):
+                    walk(x)
+                parts.append(')')
+            elif isinstance(v, type) or callable(v):
+                parts.append('<%s %s.%s>' % (type(v).__name__, getattr(v, '__module__', None),
+                                             getattr(v, '__qualname__', None)))
+            elif hasattr(v, '__dict__'):
+                parts.append('<' + type(v).__name__)
+                walk(vars(v))
+                parts.append('>')
+            else:
+                parts.append(repr(v))
+
+        walk(root)
+        digest = hashlib.sha1('\n'.join(parts).encode('utf-8', 'surrogatepass')).digest()
+        return digest, deps
+
+    def _group(self, start):
+        # The hash of the group of classes that start is in, which refer to
+        # each other (directly or not), and of the groups they refer to. The
+        # groups are found with Tarjan's algorithm, so that each class is
+        # only hashed once however many classes refer to it
+        groups = self.groups
+        if id(start) in groups:
+            return groups[id(start)]
+
+        index = {id(start): 0}
+        low = {id(start): 0}
+        stack = [start]
+        on_stack = {id(start)}
+        work = [(start, iter(self._own(start)[1]))]
+
+        while work:
+            node, deps = work[-1]
+            for dep in deps:
+                if id(dep) in groups:
+                    continue
+                if id(dep) not in index:
+                    index[id(dep)] = low[id(dep)] = len(index)
+                    stack.append(dep)
+                    on_stack.add(id(dep))
+                    work.append((dep, iter(self._own(dep)[1])))
+                    break
+                if id(dep) in on_stack:
+                    low[id(node)] = min(low[id(node)], index[id(dep)])
+            else:
+                work.pop()
+                if work:
+                    parent = id(work[-1][0])
+                    low[parent] = min(low[parent], low[id(node)])
+
+                if low[id(node)] == index[id(node)]:
+                    members = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(id(member))
+                        members.append(member)
+                        if member is node:
+                            break
+
+                    ids = {id(m) for m in members}
+                    h = hashlib.sha1()
+                    for digest in sorted(self._own(m)[0] for m in members):
+                        h.update(digest)
+                    for digest in sorted({groups[id(d)] for m in members
+                                          for d in self._own(m)[1] if id(d) not in ids}):
+                        h.update(digest)
+
+                    digest = h.digest()
+                    for m in members:
+                        groups[id(m)] = digest
+
+        return groups[id(start)]
+
+    def digest(self, v):
+        '''Returns the hash of v and of the classes it refers to'''
+        fp = self.digests.get(id(v))
+        if fp is not None:
+            return fp
+
+        digest, deps = self._own(v)
+        h = hashlib.sha1(digest)
+        if id(v) in self.classes:
+            h.update(self._group(v))
+        else:
+            for group in sorted({self._group(d) for d in deps}):
+                h.update(group)
+
+        fp = h.hexdigest()
+        if id(v) in self.classes:
+            self.digests[id(v)] = fp
+        return fp
+
+
+def _load_sources(env, name, sources, names):
+    # Adds the source of the template called name and of the templates it
+    # refers to, and the globals they read. Returns False if a template is
+    # chosen when it's rendered
+    if name in sources:
+        return True
+
+    source, _, _ = env.loader.get_source(env, name)
+    sources[name] = source
+    ast = env.parse(source, name)
+    names.update(meta.find_undeclared_variables(ast))
+
+    for ref in meta.find_referenced_templates(ast):
+        if ref is None or not _load_sources(env, ref, sources, names):
+            return False
+    return True
+
+
+def write_if_changed(fname, contents):
+    '''Writes contents to fname, unless it already holds them'''
+    try:
+        with open(fname, encoding='utf-8') as fp:
+            if fp.read() == contents:
+                return False
+    except (OSError, ValueError):
+        pass
+
+    # an interrupted write mustn't leave a truncated file that the manifest
+    # records as current
+    write_atomic(fname, contents)
+    return True
+
+
+class ClassManifest:
+    '''
+        Records what each output of class_templates was rendered from.
+        gbls are the globals that the templates are rendered with.
+    '''
+
+    def __init__(self, path, env, cfg, gbls):
+        self.path = path
+        self.env = env
+        self.cfg = cfg
+        self.gbls = gbls
+
+        self.hasher = _Hasher(c for h in gbls['headers'] for c in h.classes)
+        self.templates = {}
+        self.model = None
+
+        self.old = self._load()
+        self.outputs = {}
+        self.seen = set()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding='utf-8') as fp:
+                manifest = json.load(fp)
+        except (OSError, ValueError):
+            return {}
+
+        if not isinstance(manifest, dict) or manifest.get('version') != _MANIFEST_VERSION:
+            return {}
+        return manifest.get('outputs', {})
+
+    def _template_key(self, tmpl):
+        # the hashes of the template's sources and of the globals it reads,
+        # or None if they can't be worked out
+        sources = {}
+        names = set()
+        try:
+            if not _load_sources(self.env, basename(tmpl.src), sources, names):
+                return None
+        except jinja2.TemplateError:
+            return None
+
+        if tmpl.dst and '{' in tmpl.dst:
+            names.update(meta.find_undeclared_variables(self.env.parse(tmpl.dst)))
+
+        template = hashlib.sha1(json.dumps(
+            [tmpl.to_primitive(), sorted(sources.items())]).encode('utf-8')).hexdigest()
+
+        values = []
+        for name in sorted(names):
+            # cls is covered by the fingerprint, and per_tmpl_vars by tmpl
+            if name in ('cls', 'per_tmpl_vars', 'skip_generation') or name not in self.gbls:
+                continue
+            if name in _model_globals:
+                if self.model is None:
+                    self.model = self.hasher.digest(self.gbls['headers'])
+                value = self.model
+            elif name == 'config':
+                value = json.dumps(self.cfg.to_primitive(), sort_keys=True, default=str)
+            else:
+                value = self.hasher.digest(self.gbls[name])
+            values.append([name, value])
+
+        gbls = hashlib.sha1(json.dumps(values).encode('utf-8')).hexdigest()
+        return template, gbls
+
+    def key(self, tmpl, cls):
+        '''
+            Returns what the output of tmpl for cls is rendered from, or None
+            if that can't be worked out
+        '''
+        if id(tmpl) not in self.templates:
+            self.templates[id(tmpl)] = self._template_key(tmpl)
+
+        tkey = self.templates[id(tmpl)]
+        if tkey is None:
+            return None
+
+        return {
+            'class': self.hasher.digest(cls),
+            'template': tkey[0],
+            'globals': tkey[1],
+        }
+
+    def is_current(self, dst, key):
+        '''True if dst was rendered from key, and doesn't need rendering again'''
+        # if two classes render to the same file, both are rendered
+        old = self.old.get(dst)
+        current = key is not None and old is not None and dst not in self.seen and \
+            all(old.get(k) == v for k, v in key.items()) and \
+            (old.get('skipped', False) or exists(dst))
+
+        self.seen.add(dst)
+        if current:
+            self.outputs[dst] = old
+        return current
+
+    def record(self, dst, key, skipped=False):
+        '''Records that dst was rendered from key'''
+        if key is not None:
+            self.outputs[dst] = dict(key, skipped=True) if skipped else key
+
+    def save(self):
+        '''
+            Writes the manifest. Outputs that weren't rendered or recorded as
+            current in this run (such as those of removed classes) are left
+            out
+        '''
+        write_atomic(self.path, json.dumps({
+            'version': _MANIFEST_VERSION,
+            'outputs': self.outputs,
+        }, indent=1, sort_keys=True))
@@ -0,0 +1,103 @@
+'''
+    Deduplicates the strings in parsed headers. CppHeaderParser creates a
+    new string for every type, name, access specifier and namespace it
+    reads, so a model made from many headers holds many copies of the same
+    values. Replacing them with a single shared object for each value saves
+    a lot of memory when all of the headers are kept around for rendering.
+'''
+
+import sys
+
+# Objects from other modules (such as functions attached by hooks) aren't
+# part of the model, and aren't walked
+_model_modules = ('CppHeaderParser.', 'header2whatever.')
+
+
+class InternStats:
+    '''What :func:`intern_strings` did'''
+
+    def __init__(self):
+        #: Number of distinct string values seen
+        self.strings = 0
+        #: Number of strings replaced with an equal string seen earlier
+        self.replaced = 0
+        #: Size of the replaced strings that nothing else refers to, which
+        #: is the memory freed
+        self.bytes_saved = 0
+
+    def as_dict(self):
+        return {
+            'strings': self.strings,
+            'replaced': self.replaced,
+            'bytes_saved': self.bytes_saved,
+        }
+
+
+def intern_strings(obj, stats=None):
+    '''
+        Walks obj (and everything it refers to), replacing strings with an
+        equal string seen earlier. Only dict values, list items and the
+        attributes of objects that aren't dicts are replaced. Strings that carry extra data (such as
+        CppHeaderParser's TagStr) are left alone. Returns an
+        :class:`InternStats`.
+    '''
+    if stats is None:
+        stats = InternStats()
+
+    table = {}
+    seen = set()
+    todo = [obj]
+
+    # the strings that were replaced, kept until the end so that each is
+    # only counted once
+    replaced = {}
+
+    def _intern(v):
+        s = table.get(v)
+        if s is None:
+            table[v] = v
+            return v
+        if s is not v:
+            stats.replaced += 1
+            replaced[id(v)] = v
+        return s
+
+    while todo:
+        v = todo.pop()
+        if id(v) in seen:
+            continue
+        seen.add(id(v))
+
+        if isinstance(v, dict):
+            for k, x in v.items():
+                if type(x) is str:
+                    v[k] = _intern(x)
+                elif not isinstance(x, (str, int, float, type)) and x is not None:
+                    todo.append(x)
+        elif isinstance(v, list):
+            for i, x in enumerate(v):
+                if type(x) is str:
+                    v[i] = _intern(x)
+                elif not isinstance(x, (str, int, float, type)) and x is not None:
+                    todo.append(x)
+        elif isinstance(v, (tuple, set, frozenset)):
+            todo.extend(x for x in v if not isinstance(x, (str, int, float, type)))
+
+        # The data of CppHeaderParser's dict based objects (classes, methods,
+        # variables...) is in their items. Asking for their __dict__ would
+        # create one for each of them, which costs more than it saves
+        elif hasattr(v, '__dict__') and type(v).__module__.startswith(_model_modules):
+            todo.append(vars(v))
+
+    stats.strings = len(table)
+
+    # some of the replaced strings may still be used elsewhere, such as in
+    # dict keys. If only 'replaced' and getrefcount() refer to it, it will
+    # be freed
+    getrefcount = getattr(sys, 'getrefcount', None)
+    if getrefcount is not None:
+        for k in list(replaced):
+            if getrefcount(replaced[k]) <= 2:
+                stats.bytes_saved += sys.getsizeof(replaced[k])
+
+    return stats
@@ -0,0 +1,205 @@
+'''
+    Serialization of the parsed model, so that headers can be parsed once and
+    templates rendered from the result many times.
+
+    The model is a graph: classes refer to their parent, methods to their
+    class, the symbol index to the same classes as the headers, and so on.
+    It's written as JSON, where any container that is referred to more than
+    once gets an "$id" the first time it appears and is written as
+    {"$ref": id} after that. Objects are written with their type so that they
+    are loaded as the same CppHeaderParser/h2w classes they were dumped from.
+'''
+
+import importlib
+import json
+
+#: Bump this whenever the format changes
+MODEL_VERSION = 1
+
+# Only objects from these modules are recreated when loading
+_allowed_modules = ('CppHeaderParser.', 'header2whatever.')
+
+_builtin_types = {t.__name__: t for t in (bool, int, float, str, list, dict, tuple)}
+
+
+class ModelError(Exception):
+    pass
+
+
+def _type_name(t):
+    return '%s.%s' % (t.__module__, t.__qualname__)
+
+
+def _is_model_object(v):
+    return hasattr(v, '__dict__') and type(v).__module__.startswith(_allowed_modules)
+
+
+class _Encoder:
+    def __init__(self):
+        self.counts = {}
+        self.ids = {}
+
+    def count(self, v):
+        if isinstance(v, (list, dict)) or _is_model_object(v):
+            n = self.counts.get(id(v), 0)
+            self.counts[id(v)] = n + 1
+            if n:
+                return
+
+        if isinstance(v, dict):
+            for k, x in v.items():
+                self.count(k)
+                self.count(x)
+        elif isinstance(v, (list, tuple, set, frozenset)):
+            for x in v:
+                self.count(x)
+
+        if _is_model_object(v):
+            for x in vars(v).values():
+                self.count(x)
+
+    def encode(self, v):
+        if v is None or isinstance(v, (bool, int, float)):
+            return v
+        elif isinstance(v, str):
+            # CppHeaderParser's TagStr carries a location we don't keep
+            return str(v)
+        elif isinstance(v, type):
+            if _builtin_types.get(v.__name__) is v:
+                return {'$pytype': v.__name__}
+            return repr(v)
+        elif isinstance(v, tuple):
+            return {'$tuple': [self.encode(x) for x in v]}
+        elif isinstance(v, (set, frozenset)):
+            return [self.encode(x) for x in v]
+
+        model_object = _is_model_object(v)
+        if not model_object and not isinstance(v, (list, dict)):
+            return repr(v)
+
+        n = self.ids.get(id(v))
+        if n is not None:
+            return {'$ref': n}
+
+        r = {}
+        if self.counts.get(id(v), 0) > 1:
+            n = self.ids[id(v)] = len(self.ids)
+            r['$id'] = n
+
+        if model_object:
+            r['$type'] = _type_name(type(v))
+            if isinstance(v, dict):
+                r['$items'] = self._encode_dict(v)
+            elif isinstance(v, list):
+                r['$list'] = [self.encode(x) for x in v]
+            r['$attrs'] = self._encode_dict(vars(v))
+            return r
+        elif isinstance(v, list):
+            items = [self.encode(x) for x in v]
+            if not r:
+                return items
+            r['$list'] = items
+            return r
+        else:
+            items = self._encode_dict(v)
+            if isinstance(items, list):
+                r['$dict'] = items
+            else:
+                r.update(items)
+            return r
+
+    def _encode_dict(self, d):
+        # Dicts are written as JSON objects unless a key isn't a string or
+        # could be mistaken for one of our markers
+        if all(isinstance(k, str) and not k.startswith('$') for k in d):
+            return {k: self.encode(x) for k, x in d.items()}
+        return [[self.encode(k), self.encode(x)] for k, x in d.items()]
+
+
+class _Decoder:
+    def __init__(self):
+        self.objects = {}
+
+    def decode(self, v):
+        if isinstance(v, list):
+            return [self.decode(x) for x in v]
+        elif not isinstance(v, dict):
+            return v
+
+        if '$ref' in v:
+            return self.objects[v['$ref']]
+        elif '$pytype' in v:
+            return _builtin_types[v['$pytype']]
+        elif '$tuple' in v:
+            return tuple(self.decode(x) for x in v['$tuple'])
+
+        if '$type' in v:
+            t = _find_type(v['$type'])
+            r = t.__new__(t)
+        elif '$list' in v:
+            r = []
+        else:
+            r = {}
+
+        # register before decoding the contents, which may refer to it
+        if '$id' in v:
+            self.objects[v['$id']] = r
+
+        if '$type' in v:
+            if '$items' in v:
+                r.update(self._decode_dict(v['$items']))
+            if '$list' in v:
+                r.extend(self.decode(v['$list']))
+            r.__dict__.update(self._decode_dict(v['$attrs']))
+        elif '$list' in v:
+            r.extend(self.decode(v['$list']))
+        elif '$dict' in v:
+            r.update(self._decode_dict(v['$dict']))
+        else:
+            for k, x in v.items():
+                if k != '$id':
+                    r[k] = self.decode(x)
+
+        return r
+
+    def _decode_dict(self, d):
+        if isinstance(d, list):
+            return [(self.decode(k), self.decode(x)) for k, x in d]
+        return [(k, self.decode(x)) for k, x in d.items()]
+
+
+def _find_type(name):
+    if not name.startswith(_allowed_modules):
+        raise ModelError("refusing to load object of type %s" % name)
+    modname, _, clsname = name.rpartition('.')
+    try:
+        return getattr(importlib.import_module(modname), clsname)
+    except (ImportError, AttributeError) as e:
+        raise ModelError("unknown type %s" % name) from e
+
+
+def dump_model(model, fp):
+    '''
+        Writes a model (the dict returned by :func:`.parse_config`) to the
+        file object fp. Values that aren't part of the parsed data, such as
+        functions that hooks may have attached, are written as their repr.
+    '''
+    encoder = _Encoder()
+    encoder.count(model)
+    json.dump({'h2w_model': MODEL_VERSION, 'model': encoder.encode(model)},
+              fp, separators=(',', ':'))
+
+
+def load_model(fp):
+    '''Reads a model written by :func:`dump_model` from the file object fp'''
+    try:
+        raw = json.load(fp)
+    except ValueError as e:
+        raise ModelError("invalid model file: %s" % e) from e
+
+    version = raw.get('h2w_model') if isinstance(raw, dict) else None
+    if version != MODEL_VERSION:
+        raise ModelError("model file version %s is not supported (expected %s)"
+                         % (version, MODEL_VERSION))
+
+    return _Decoder().decode(raw['model'])
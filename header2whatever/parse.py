@@ -1,16 +1,30 @@
 
 import argparse
+import json
 import os
+import re
+import sys
 from os.path import basename, dirname, exists, join, relpath
 import tempfile
+import time
 
-import CppHeaderParser
 import jinja2
 import yaml
 
 from . import default_hooks
+from ._pcpp import PreprocessorStats
+from .cache import PreprocessCache
 from .config import Config, Template
-from .preprocess import preprocess_file
+from .analyze import analyze_templates
+from .dump import dump_json
+from .incremental import ClassManifest, write_if_changed
+from .interning import intern_strings
+from .model import dump_model, load_model
+from .parsers import get_parser
+from .preprocess import line_filename, needs_preprocessing, preprocess_file
+from .prune import prune_headers
+from .scan import select_declarations, strip_doxygen, strip_function_bodies
+from .symbols import FileContents, SymbolIndex
 from .util import import_file, read_file
 
 class CppHeaderParserError(Exception):
@@ -42,32 +56,171 @@ def _process_class(cls, hooks, data):
 
     call_hook(cls["name"], hooks, 'class_hook', cls, data)
 
-def _only_this_file(l, fname):
-    r = []
-    for i in l:
-        if 'filename' not in i:
-            raise ValueError(i)
-        if i['filename'] == fname:
-            r.append(i)
-    return r
-
-def process_header(cfg, fname, hooks, data):
-    '''Returns a list of lines'''
+def _index_by_file(header, fname):
+    '''
+        Returns a dict of FileContents keyed by the name of the file that each
+        item was declared in, as it appears in #line directives. Items without
+        a filename (the header wasn't preprocessed) were declared in fname.
+    '''
+    default = line_filename(fname)
+    by_file = {}
+
+    def _get(item):
+        fn = item.get('filename', default)
+        contents = by_file.get(fn)
+        if contents is None:
+            contents = by_file[fn] = FileContents()
+        return contents
+
+    for cls in header.classes_order:
+        _get(cls).classes.append(cls)
+    for fn in header.functions:
+        _get(fn).functions.append(fn)
+    for enum in header.enums:
+        _get(enum).enums.append(enum)
+    for name, enum in header.global_enums.items():
+        _get(enum).global_enums[name] = enum
+    for var in header.variables:
+        _get(var).variables.append(var)
+
+    by_file.setdefault(default, FileContents())
+    return by_file
+
+# Things that CppHeaderParser doesn't see as NAME tokens
+_skip_re = r'//[^\n]*|/\*.*?\*/|"(?:[^"\\\n]|\\.)*"|\'(?:[^\'\\\n]|\\.)*\'|^[ \t]*#(?:\\\n|[^\n])*'
+_paren_re = re.compile(_skip_re + r'|[()]', re.M | re.S)
+
+def _call_end(contents, pos):
+    # the end of the call whose arguments start at pos, or None if its
+    # parens don't balance
+    depth = 1
+    for m in _paren_re.finditer(contents, pos):
+        tok = m.group()
+        if tok == '(':
+            depth += 1
+        elif tok == ')':
+            depth -= 1
+            if not depth:
+                return m.end()
+    return None
+
+def _strip_ignored_symbols(contents, ignore_symbols):
+    '''
+        Does what adding ignore_symbols to CppHeaderParser.ignoreSymbols
+        would, but without modifying global state: identifiers are replaced
+        with spaces, and for entries ending with () the whole call is
+        replaced with its newlines, so line numbers stay the same. Comments,
+        strings and preprocessor lines are left alone.
+    '''
+    names = []
+    calls = []
+    for sym in ignore_symbols:
+        if sym.endswith('()'):
+            calls.append(re.escape(sym[:-2]))
+        else:
+            names.append(re.escape(sym))
+
+    alts = [_skip_re]
+    if calls:
+        alts.append(r'\b(?P<call>%s)\s*\(' % '|'.join(calls))
+    if names:
+        alts.append(r'\b(?P<name>%s)\b' % '|'.join(names))
+    pat = re.compile('|'.join(alts), re.M | re.S)
+
+    out = []
+    last = 0
+    pos = 0
+    while True:
+        m = pat.search(contents, pos)
+        if not m:
+            break
+        pos = m.end()
+
+        if m.lastgroup == 'name':
+            out.append(contents[last:m.start()])
+            out.append(' ' * len(m.group()))
+            last = pos
+        elif m.lastgroup == 'call':
+            end = _call_end(contents, pos)
+            if end is not None:
+                out.append(contents[last:m.start()])
+                out.append('\n' * contents.count('\n', m.start(), end))
+                last = pos = end
+
+    out.append(contents[last:])
+    return ''.join(out)
+
+def _source_date_epoch():
+    # SOURCE_DATE_EPOCH is a number of seconds, like date +%s prints. An
+    # empty value is the same as not setting it
+    value = os.environ.get('SOURCE_DATE_EPOCH', '').strip()
+    if not value:
+        return 0
+    try:
+        return int(value)
+    except ValueError:
+        raise PreprocessorError("SOURCE_DATE_EPOCH must be an integer number of seconds "
+                                "since the epoch, not %r" % value) from None
+
+def parse_header(cfg, fname, pp_stats=None, parser=None, drop_doxygen=False):
+    '''
+        Parses a header without calling any hooks. parser is the parse
+        function of the backend to use, which defaults to cfg.parser. If
+        drop_doxygen is True, doxygen comments aren't collected.
+    '''
+
+    preprocess = cfg.preprocess
+    if preprocess == 'auto':
+        preprocess = cfg.pp_retain_all_content or \
+                     needs_preprocessing(fname, cfg.pp_include_paths, cfg.pp_defines)
+
+    volatile = set()
+    if preprocess:
+        cache = None
+        if cfg.pp_cache_dir:
+            cache = PreprocessCache(cfg.pp_cache_dir, cfg.pp_cache_size)
+
+        epoch = None
+        if cfg.pp_reproducible:
+            epoch = cfg.pp_source_date_epoch
+            if epoch is None:
+                epoch = _source_date_epoch()
 
-    if cfg.preprocess:
         try:
             contents = preprocess_file(fname,
                                     cfg.pp_include_paths,
                                     cfg.pp_retain_all_content,
-                                    cfg.pp_defines)
+                                    cfg.pp_defines,
+                                    cfg.pp_fast_lexer,
+                                    cache,
+                                    cfg.pp_backend,
+                                    cfg.pp_prefetch_workers,
+                                    pp_stats,
+                                    epoch,
+                                    volatile,
+                                    cfg.pp_comments)
         except Exception as e:
             raise PreprocessorError("processing " + fname) from e
     else:
         contents = read_file(fname)
 
+    if cfg.ignore_symbols:
+        contents = _strip_ignored_symbols(contents, cfg.ignore_symbols)
+
+    if cfg.only_classes or cfg.only_namespaces:
+        contents = select_declarations(contents, cfg.only_classes, cfg.only_namespaces)
+
+    if cfg.strip_function_bodies:
+        contents = strip_function_bodies(contents)
+
+    if drop_doxygen:
+        contents = strip_doxygen(contents)
+
+    if parser is None:
+        parser = get_parser(cfg.parser)
+
     try:
-        header = CppHeaderParser.CppHeader(contents,
-                                        argType='string', preprocessed=True)
+        header = parser(contents, cfg)
     except Exception as e:
         raise CppHeaderParserError("processing " + fname) from e
 
@@ -80,6 +233,11 @@ def process_header(cfg, fname, hooks, data):
 
     header.fname = basename(fname)
 
+    # macros such as __DATE__ that make the preprocessed output differ
+    # between runs
+    header.pp_volatile_macros = sorted(volatile)
+    header.pp_deterministic = not volatile
+
     header.classes = header.classes_order
 
     # move and filter
@@ -89,13 +247,20 @@ def process_header(cfg, fname, hooks, data):
     header.all_global_enums = header.global_enums
     header.all_variables = header.variables
 
-    if cfg.preprocess and cfg.pp_retain_all_content:
-        header.classes = _only_this_file(header.classes, fname)
-        header.functions = _only_this_file(header.functions, fname)
-        header.enums = _only_this_file(header.enums, fname)
-        header.global_enums = _only_this_file(header.global_enums, fname)
-        header.variables = _only_this_file(header.variables, fname)
+    # header.by_file[name].classes etc. are the items declared in each file
+    header.by_file = _index_by_file(header, fname)
+
+    if preprocess and cfg.pp_retain_all_content:
+        this_file = header.by_file[line_filename(fname)]
+        header.classes = this_file.classes
+        header.functions = this_file.functions
+        header.enums = this_file.enums
+        header.global_enums = this_file.global_enums
+        header.variables = this_file.variables
 
+    return header
+
+def _call_header_hooks(header, hooks, data):
     for cls in header.classes:
         _process_class(cls, hooks, data)
 
@@ -103,14 +268,69 @@ def process_header(cfg, fname, hooks, data):
         call_hook(fn["name"], hooks, 'function_hook', fn, data)
 
     call_hook(header.fname, hooks, 'header_hook', header, data)
-    return header
 
-def process_module(cfg, hooks, data):
+def process_header(cfg, fname, hooks, data, pp_stats=None):
+    '''Parses a header and calls the hooks for it'''
+    header = parse_header(cfg, fname, pp_stats)
+    _call_header_hooks(header, hooks, data)
+    return header
 
-    headers = [process_header(cfg, header, hooks, data) for header in cfg.headers]
+def process_module(cfg, hooks, data, usage=None, drop_doxygen=False):
+
+    pp_stats = PreprocessorStats() if cfg.preprocess and cfg.pp_stats else None
+    stats = {'headers': {}} if cfg.parse_stats else None
+
+    parser = get_parser(cfg.parser)
+    headers = []
+    for fname in cfg.headers:
+        start = time.perf_counter()
+        headers.append(parse_header(cfg, fname, pp_stats, parser, drop_doxygen))
+        if stats is not None:
+            stats['headers'][fname] = {'time': time.perf_counter() - start}
+
+    if pp_stats:
+        with open(cfg.pp_stats, 'w', encoding='utf-8') as fp:
+            json.dump(pp_stats.as_dict(), fp, indent=2)
+
+    if cfg.intern_strings:
+        start = time.perf_counter()
+        interned = intern_strings(headers)
+        if stats is not None:
+            stats['intern'] = interned.as_dict()
+            stats['intern']['time'] = time.perf_counter() - start
+
+    # All headers are parsed before any hooks are called, so that hooks
+    # can look up declarations from any of them
+    symbols = SymbolIndex()
+    for header in headers:
+        symbols.add_header(header)
+    symbols.resolve_hierarchy()
+
+    data['symbols'] = symbols
+
+    start = time.perf_counter()
+    for header in headers:
+        _call_header_hooks(header, hooks, data)
+
+    if stats is not None:
+        stats['hooks'] = {'time': time.perf_counter() - start}
+        with open(cfg.parse_stats, 'w', encoding='utf-8') as fp:
+            json.dump(stats, fp, indent=2)
+
+    fields = cfg.fields
+    if not fields and usage is not None:
+        fields = usage.fields()
+
+    if fields:
+        fields = dict(fields)
+        # class_templates are rendered for each of header.classes
+        if cfg.class_templates and 'header' in fields:
+            fields['header'] = list(fields['header']) + ['classes']
+        prune_headers(headers, fields, symbols)
 
     data = {}
     data['headers'] = headers
+    data['symbols'] = symbols
 
     # optimization for single-header use case
     if len(headers) == 1:
@@ -129,20 +349,22 @@ class ConfigProcessor:
         )
         self.hookobj = hookobj
 
+        # output names are rendered for each class
+        self._dst_templates = {}
+
     def process_config(self, cfg, data=None, hookobj=None):
         # If data is passed in, this is used for data instead of loading it
-        # from file
-        old_ignored = CppHeaderParser.ignoreSymbols
-        CppHeaderParser.ignoreSymbols = old_ignored[:]
-        if cfg.ignore_symbols:
-            CppHeaderParser.ignoreSymbols.extend(cfg.ignore_symbols)
-
-        try:
-            return self._process_config(cfg, data, hookobj)
-        finally:
-            CppHeaderParser.ignoreSymbols = old_ignored
-
-    def _process_config(self, cfg, data, hookobj):
+        # from file. Configs can be processed concurrently from multiple
+        # threads, though CppHeaderParser only parses one header at a time
+        model = self.parse_config(cfg, data, hookobj)
+        self.render_config(cfg, model)
+
+    def parse_config(self, cfg, data=None, hookobj=None):
+        '''
+            Parses the headers and calls the hooks. Returns the model that
+            templates are rendered from: headers, header (if there's only
+            one), symbols and data (if there is any)
+        '''
         # Setup the default hooks first
         hook_modules = [default_hooks]
         if cfg.hooks:
@@ -159,9 +381,7 @@ class ConfigProcessor:
                 if fn:
                     hooks.setdefault(n, []).append(fn)
 
-        gbls = {}
-        gbls['config'] = cfg
-        gbls.update(cfg.vars)
+        gbls = self._globals(cfg)
 
         if data is not None:
             gbls['data'] = data
@@ -171,123 +391,304 @@ class ConfigProcessor:
 
             if gbls['data'] is None:
                 gbls['data'] = {}
-        
-        # Provide an escape mechanism
-        def _skip_generation():
-            raise SkipGeneration()
 
-        gbls['skip_generation'] = _skip_generation
+        usage = None
+        drop_doxygen = False
+        if cfg.analyze_templates and not cfg.fields:
+            usage = analyze_templates(self._env, cfg)
+
+            # hooks may read doxygen comments, even if templates don't
+            if usage is not None and len(hook_modules) == 1:
+                drop_doxygen = not usage.reads('doxygen') and \
+                                not usage.reads('desc', ('variable',))
 
         # Process the module
-        data = process_module(cfg, hooks, gbls)
+        model = process_module(cfg, hooks, gbls, usage, drop_doxygen)
+        if 'data' in gbls:
+            model['data'] = gbls['data']
+
+        return model
 
-        gbls.update(data)
+    def render_config(self, cfg, model):
+        '''Renders the templates in cfg from a model returned by parse_config'''
+        gbls = self._globals(cfg)
+        gbls.update(model)
 
         for tmpl in cfg.templates:
             self._render_template(tmpl, gbls)
             
         if cfg.class_templates:
-            for header in data["headers"]:
+            manifest = None
+            if cfg.class_manifest:
+                manifest = ClassManifest(cfg.class_manifest, self._env, cfg, gbls)
+
+            for header in model["headers"]:
                 for clsdata in header.classes:
                     gbls["cls"] = clsdata
                     for tmpl in cfg.class_templates:
-                        self._render_template(tmpl, gbls)
+                        self._render_template(tmpl, gbls, manifest)
+
+            if manifest is not None:
+                manifest.save()
+
+    def _globals(self, cfg):
+        gbls = {}
+        gbls['config'] = cfg
+        gbls.update(cfg.vars)
+
+        # Provide an escape mechanism
+        def _skip_generation():
+            raise SkipGeneration()
+
+        gbls['skip_generation'] = _skip_generation
+        return gbls
 
-    def _render_template(self, tmpl, data):
+    def _render_template(self, tmpl, data, manifest=None):
         
         jtmpl = self._env.get_template(basename(tmpl.src))
 
         data["per_tmpl_vars"] = tmpl.vars
 
+        # with a manifest, the output name is needed to tell whether it's
+        # current before rendering
+        dst = tmpl.dst
+        key = None
+        if dst and manifest is not None:
+            dst = self._output_name(dst, data)
+            key = manifest.key(tmpl, data["cls"])
+            if manifest.is_current(dst, key):
+                return
+
         try:
             s = jtmpl.render(**data)
         except SkipGeneration:
+            if manifest is not None:
+                manifest.record(dst, key, skipped=True)
             return
 
-        dst = tmpl.dst
-        if dst:
-            if '{' in dst:
-                env = jinja2.Environment(
-                    loader=jinja2.FunctionLoader(lambda _: dst),
-                    undefined=jinja2.StrictUndefined,
-                )
-                dst = env.get_template('_').render(**data)
+        if dst and manifest is not None:
+            write_if_changed(dst, s)
+            manifest.record(dst, key)
+        elif dst:
+            dst = self._output_name(dst, data)
             
             with open(dst, 'w', encoding='utf-8') as fp:
                 fp.write(s)
         else:
             print(s)
 
-def process_config(cfg, data=None, hooks=None):
+    def _output_name(self, dst, data):
+        if '{' in dst:
+            jtmpl = self._dst_templates.get(dst)
+            if jtmpl is None:
+                env = jinja2.Environment(
+                    loader=jinja2.FunctionLoader(lambda _: dst),
+                    undefined=jinja2.StrictUndefined,
+                )
+                jtmpl = self._dst_templates[dst] = env.get_template('_')
+            dst = jtmpl.render(**data)
+        return dst
+
+def _config_processor(cfg, hooks=None):
     searchpath = set()
     for tmpl in cfg.templates:
         searchpath.add(dirname(tmpl.src))
     for tmpl in cfg.class_templates:
         searchpath.add(dirname(tmpl.src))
     
-    cp = ConfigProcessor(searchpath, hooks)
+    return ConfigProcessor(searchpath, hooks)
+
+def process_config(cfg, data=None, hooks=None):
+    cp = _config_processor(cfg, hooks)
     cp.process_config(cfg, data)
 
+def parse_config(cfg, data=None, hooks=None):
+    '''Parses the headers in cfg and returns the model, without rendering'''
+    cp = ConfigProcessor([], hooks)
+    return cp.parse_config(cfg, data)
 
-def main():
-    parser = argparse.ArgumentParser()
+def render_config(cfg, model):
+    '''Renders the templates in cfg from a model returned by parse_config'''
+    cp = _config_processor(cfg)
+    cp.render_config(cfg, model)
 
-    parser.add_argument('template', help='Jinja2 template to use for generation. If set to "pprint", then it will output the data structure available')
-    parser.add_argument('headers', nargs=argparse.REMAINDER)
-    parser.add_argument('-o', '--output', help='Output results to specified file')
+
+_template_help = ('Jinja2 template to use for generation. If set to "pprint", then it will output the data structure available. '
+                  'If set to "json" or "jsonl", the headers are dumped as a JSON array or as JSON lines')
+_select_help = ('With json/jsonl, only dump the values at this dotted path in each header, for example '
+                'classes.Foo.methods.public (a name picks items from a list by name, * picks every item)')
+
+def _add_config_arguments(parser):
     parser.add_argument('-p', '--param', nargs='+', help="k=v parameter", default=[])
     parser.add_argument('-d', '--data', help='Load YAML data file and make it available under the data key')
     
     parser.add_argument('--preprocess', action='store_true', default=False, help="Preprocess file with pcpp")
+    parser.add_argument('--preprocess-auto', action='store_true', default=False,
+                        help="Preprocess file with pcpp only if it looks like it needs it")
     parser.add_argument('--pp-retain-all-content', action='store_true', default=False)
     parser.add_argument('--include', '-I', action='append', default=[], help="Preprocessor include paths")
     parser.add_argument('--define', '-D', action='append', default=[], help="Preprocessor #define macros")
+    parser.add_argument('--pp-cache', help="Directory to cache preprocessed output in")
+    parser.add_argument('--pp-stats', help="Write preprocessor statistics to this file as JSON")
+    parser.add_argument('--pp-reproducible', action='store_true', default=False,
+                        help="Set __DATE__ and __TIME__ from SOURCE_DATE_EPOCH (or 0) so output is reproducible")
+    parser.add_argument('--pp-comments', choices=['all', 'doxygen', 'none'], default='all',
+                        help="Comments to keep when preprocessing")
+    parser.add_argument('--pp-backend', choices=['pcpp', 'gcc', 'clang'], default='pcpp',
+                        help="Preprocessor to use (pcpp is used if the compiler isn't installed)")
+    parser.add_argument('--parser', default='cppheaderparser',
+                        help="Parser backend: cppheaderparser, or a python file or module defining parse(contents, cfg)")
+    parser.add_argument('--only-class', action='append', default=[],
+                        help="Only parse classes with this name or pattern")
+    parser.add_argument('--only-namespace', action='append', default=[],
+                        help="Only parse declarations in this namespace (name or pattern)")
+    parser.add_argument('--strip-bodies', action='store_true', default=False,
+                        help="Remove the bodies of inline functions before parsing")
+    parser.add_argument('--intern-strings', action='store_true', default=False,
+                        help="Share one copy of each string in the parsed headers to save memory")
+    parser.add_argument('--parse-stats', help="Write parse timings and memory saved by interning to this file as JSON")
+    parser.add_argument('--parse-workers', type=int, default=0,
+                        help="Parse large headers in parallel using this many processes")
 
     parser.add_argument('--hooks', help='Specify custom hooks file to load')
-    
-
-    args = parser.parse_args()
 
+def _config_from_args(args):
     # convert the arguments into a Config object
     cfg = Config()
 
-    tmpl = Template()
-    cfg.templates = [tmpl]
-
     cfg.headers = args.headers
-    tmpl.src = args.template
-    tmpl.dst = args.output
     cfg.hooks = args.hooks
     cfg.data = args.data
-    cfg.preprocess = args.preprocess
+    cfg.preprocess = 'auto' if args.preprocess_auto else args.preprocess
     cfg.pp_include_paths = args.include
     cfg.pp_defines = args.define
     cfg.pp_retain_all_content = args.pp_retain_all_content
+    cfg.pp_cache_dir = args.pp_cache
+    cfg.pp_backend = args.pp_backend
+    cfg.pp_stats = args.pp_stats
+    cfg.pp_reproducible = args.pp_reproducible
+    cfg.pp_comments = args.pp_comments
+    cfg.parser = args.parser
+    cfg.parse_workers = args.parse_workers
+    cfg.intern_strings = args.intern_strings
+    cfg.parse_stats = args.parse_stats
+    cfg.strip_function_bodies = args.strip_bodies
+    cfg.only_classes = args.only_class
+    cfg.only_namespaces = args.only_namespace
+
+    _set_params(cfg, args.param)
+    return cfg
+
+def _set_params(cfg, params):
+    for p in params:
+        if '=' not in p:
+            raise ValueError("Invalid --param `%s`" % p)
+        pp = p.split('=', 2)
+        cfg.vars[pp[0]] = pp[1]
+
+def _render_main(cfg, template, output, render):
+    tmpl = Template()
+    cfg.templates = [tmpl]
+    tmpl.src = template
+    tmpl.dst = output
 
     # Special hook
     tmpfile = None
-    if args.template == 'pprint':
+    if template == 'pprint':
         tmpfile = tempfile.NamedTemporaryFile()
         tmpfile.write(b'{% for h in headers %}\n{{ h.__dict__ | pprint }}\n{% endfor %}\n')
         tmpfile.flush()
         tmpl.src = tmpfile.name
 
     try:
-
-        for p in args.param:
-            if '=' not in p:
-                raise ValueError("Invalid --param `%s`" % p)
-            pp = p.split('=', 2)
-            cfg.vars[pp[0]] = pp[1]
-
         cfg.validate()
-
-        process_config(cfg)
+        render(cfg)
     finally:
         if tmpfile:
             tmpfile.close()
 
 
+# Templates names that dump the headers instead of rendering a template
+_dump_formats = ('json', 'jsonl')
+
+def _dump_main(model, fmt, output, selector):
+    if output:
+        with open(output, 'w', encoding='utf-8') as fp:
+            dump_json(model['headers'], fp, selector, fmt == 'jsonl')
+    else:
+        dump_json(model['headers'], sys.stdout, selector, fmt == 'jsonl')
+
+def main():
+    # 'h2w parse' and 'h2w render' split the work into two steps
+    if len(sys.argv) > 1 and sys.argv[1] == 'parse':
+        return parse_main(sys.argv[2:])
+    elif len(sys.argv) > 1 and sys.argv[1] == 'render':
+        return render_main(sys.argv[2:])
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('template', help=_template_help)
+    parser.add_argument('headers', nargs=argparse.REMAINDER)
+    parser.add_argument('-o', '--output', help='Output results to specified file')
+    parser.add_argument('--select', help=_select_help)
+    parser.add_argument('--analyze-templates', action='store_true', default=False,
+                        help="Only keep the parts of the headers that the template uses")
+    _add_config_arguments(parser)
+
+    args = parser.parse_args()
+    cfg = _config_from_args(args)
+    cfg.analyze_templates = args.analyze_templates
+
+    if args.template in _dump_formats:
+        cfg.validate()
+        _dump_main(parse_config(cfg), args.template, args.output, args.select)
+    else:
+        _render_main(cfg, args.template, args.output, process_config)
+
+
+def parse_main(argv=None):
+    parser = argparse.ArgumentParser(prog='h2w parse',
+                                     description='Parse headers and write the model to a file for h2w render')
+
+    parser.add_argument('headers', nargs='+')
+    parser.add_argument('-o', '--output', required=True, help='Model file to write')
+    _add_config_arguments(parser)
+
+    args = parser.parse_args(argv)
+    cfg = _config_from_args(args)
+    cfg.validate()
+
+    model = parse_config(cfg)
+    with open(args.output, 'w', encoding='utf-8') as fp:
+        dump_model(model, fp)
+
+
+def render_main(argv=None):
+    parser = argparse.ArgumentParser(prog='h2w render',
+                                     description='Render a template from a model written by h2w parse')
+
+    parser.add_argument('model', help='Model file written by h2w parse')
+    parser.add_argument('template', help=_template_help)
+    parser.add_argument('-o', '--output', help='Output results to specified file')
+    parser.add_argument('-p', '--param', nargs='+', help="k=v parameter", default=[])
+    parser.add_argument('--select', help=_select_help)
+
+    args = parser.parse_args(argv)
+
+    with open(args.model, encoding='utf-8') as fp:
+        model = load_model(fp)
+
+    if args.template in _dump_formats:
+        _dump_main(model, args.template, args.output, args.select)
+        return
+
+    cfg = Config()
+    cfg.headers = [h.full_fname for h in model['headers']]
+    _set_params(cfg, args.param)
+
+    _render_main(cfg, args.template, args.output, lambda cfg: render_config(cfg, model))
+
+
 def batch():
     parser = argparse.ArgumentParser()
     parser.add_argument('config')
@@ -331,6 +732,9 @@ def batch_convert(config_path, outdir, root):
 
         # resolve files relative to the configuration
         # -> hooks and templates are expected to be near config
+        if cfg.class_manifest:
+            cfg.class_manifest = join(outdir, cfg.class_manifest)
+
         if cfg.data:
             cfg.data = join(cfgdir, cfg.data)
 
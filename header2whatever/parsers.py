@@ -0,0 +1,101 @@
+'''
+    Parser backends. The ``parser`` config option selects the backend used to
+    read headers: 'cppheaderparser' (the default), or else the name of a
+    python file or module that defines::
+
+        def parse(contents, cfg):
+            ...
+
+    contents is the (possibly preprocessed) text of the header, and cfg is
+    the :class:`.Config`. It returns an object with the same attributes that
+    a CppHeaderParser.CppHeader has, containing dicts of the same shape, as
+    that's what hooks and templates are written against:
+
+    - classes_order: list of class dicts in source order. Each class has
+      name, namespace, parent, inherits, line_number, nested_classes, and
+      methods, properties, enums and typedefs dicts keyed by access
+      ('public', 'protected', 'private')
+    - classes: the class dicts keyed by (nested) name
+    - functions: list of function dicts (name, namespace, rtnType,
+      parameters, line_number, ...)
+    - enums: list of enum dicts (name, namespace, values, ...)
+    - global_enums: dict of enums keyed by name
+    - variables: list of variable dicts
+    - typedefs: dict mapping typedef names to the type they refer to
+    - using: dict of using declarations/aliases keyed by name
+    - pragmas, defines and includes: lists of strings
+
+    Items that came from another file (when preprocessing with
+    pp_retain_all_content) should have a 'filename' as used by #line
+    directives.
+
+    A backend can fill in a :class:`ParsedHeader`, which has all of those
+    attributes, and can be written to a model file by ``h2w parse``.
+
+    When configs are processed from multiple threads, parse may be called
+    from several threads at once.
+'''
+
+import importlib
+from os.path import exists
+import threading
+
+import CppHeaderParser
+
+from .chunked import parse_chunked
+from .util import import_file
+
+
+class ParsedHeader:
+    '''An empty header for parser backends to fill in'''
+
+    def __init__(self):
+        self.classes = {}
+        self.classes_order = []
+        self.functions = []
+        self.enums = []
+        self.global_enums = {}
+        self.variables = []
+        self.typedefs = {}
+        self.using = {}
+        self.pragmas = []
+        self.defines = []
+        self.includes = []
+
+
+# CppHeaderParser keeps state in module globals while it parses (such as
+# parseHistory, Resolver.CLASSES and CppVariable.Vars), so only one thread
+# can parse at a time
+_cppheaderparser_lock = threading.Lock()
+
+
+def parse_cppheaderparser(contents, cfg):
+    with _cppheaderparser_lock:
+        if cfg.parse_workers:
+            return parse_chunked(contents, cfg.parse_workers, cfg.parse_chunk_lines)
+        return CppHeaderParser.CppHeader(contents, argType='string', preprocessed=True)
+
+
+_builtin = {
+    'cppheaderparser': parse_cppheaderparser,
+}
+
+
+def get_parser(name):
+    '''
+        Returns the parse function for a backend: a builtin backend, a python
+        file, or a module name
+    '''
+    parser = _builtin.get(name)
+    if parser is not None:
+        return parser
+
+    if name.endswith('.py') or exists(name):
+        module = import_file(name)
+    else:
+        module = importlib.import_module(name)
+
+    parser = getattr(module, 'parse', None)
+    if parser is None:
+        raise ValueError("parser %s does not define parse(contents, cfg)" % name)
+    return parser
@@ -1,10 +1,15 @@
 
 import io
-from os.path import dirname, relpath
+import os
+from os.path import abspath, dirname, isfile, join, relpath
+import re
+import shutil
 import subprocess
 import sys
+import time
 
-from ._pcpp import Preprocessor, OutputDirective, Action
+from ._pcpp import Preprocessor, OutputDirective, Action, FastLexer, IncludePrefetcher
+from .scan import doxygen_prefixes
 from .util import read_file
 
 class PreprocessorError(Exception):
@@ -12,33 +17,52 @@ class PreprocessorError(Exception):
 
 class H2WPreprocessor(Preprocessor):
 
-    def __init__(self):
-        Preprocessor.__init__(self)
+    def __init__(self, fast_lexer=True, comments='all'):
+        Preprocessor.__init__(self, FastLexer() if fast_lexer else None)
         self.errors = []
+        self.comments = comments
 
     def on_error(self,file,line,msg):
         self.errors.append('%s:%d error: %s' % (file, line, msg))
+        self.return_code += 1
 
     def on_include_not_found(self,is_system_include,curdir,includepath):
         raise OutputDirective(Action.IgnoreAndPassThrough)
 
     def on_comment(self,tok):
-        return True
+        if self.comments == 'all':
+            return True
+        elif self.comments == 'doxygen':
+            if not tok.value.startswith(doxygen_prefixes):
+                # CppHeaderParser doesn't attach doxygen across a blank line,
+                # but a comment (which takes its newline with it) doesn't
+                # count as one. So other comments are emptied rather than
+                # removed, keeping their newlines, and doxygen is attached
+                # the same way as with 'all'
+                if tok.value.startswith('//'):
+                    tok.value = '//'
+                else:
+                    tok.value = '/*%s*/' % ('\n' * tok.value.count('\n') or ' ')
+            return True
+        return False
 
 
-def _filter_self(fname, fp):
-    # the output of pcpp includes the contents of all the included files,
-    # which isn't what a typical user of h2w would want, so we strip out
-    # the line directives and any content that isn't in our original file
-
+def line_filename(fname):
+    '''Returns the name that #line directives in preprocessed output use for fname'''
     # Compute the filename to match based on how pcpp does it
     try:
         relfname = relpath(fname)
     except Exception:
         relfname = fname
-    relfname = relfname.replace('\\', '/')
+    return relfname.replace('\\', '/')
+
+
+def _filter_self(fname, fp):
+    # the output of pcpp includes the contents of all the included files,
+    # which isn't what a typical user of h2w would want, so we strip out
+    # the line directives and any content that isn't in our original file
 
-    relfname += '"\n'
+    relfname = line_filename(fname) + '"\n'
 
     new_output = io.StringIO()
     keep = True
@@ -54,13 +78,105 @@ def _filter_self(fname, fp):
     return new_output.read()
 
 
-def preprocess_file(fname, include_paths=[], retain_all_content=False, defines=[]):
+_define_re = re.compile(r'^([A-Za-z_]\w*(?:\([^)]*\))?)\s*(.*)$', re.S)
+_linemarker_re = re.compile(r'^# (\d+) "((?:[^"\\]|\\.)*)"((?: \d+)*)')
+
+# -Wdate-time warnings: gcc names the macro, clang doesn't
+_date_time_re = re.compile(r'warning: (?:macro "(\w+)" might prevent reproducible|'
+                           r'expansion of (date or time macro) is not reproducible)')
+
+
+_directive_re = re.compile(r'^[ \t]*#[ \t]*(\w*)(.*)$', re.M)
+_guard_re = re.compile(r'^\s*!\s*defined\s*\(?\s*(\w+)\s*\)?\s*$')
+_include_re = re.compile(r'^\s*(?:"([^"]+)"|<([^>]+)>)')
+_ident_re = re.compile(r'[A-Za-z_]\w*')
+
+
+def _scan_directives(contents):
+    # returns list of (directive, rest of line) with continuations joined
+    contents = contents.replace('\\\n', ' ')
+    return [(m.group(1), m.group(2).strip()) for m in _directive_re.finditer(contents)]
+
+
+def _find_include(name, is_system, curdir, include_paths):
+    paths = include_paths if is_system else [curdir] + include_paths
+    for p in paths:
+        iname = join(p, name)
+        if isfile(iname):
+            return iname
+
+
+def _included_macros(fname, include_paths, seen):
+    # names #defined by the files that fname includes, recursively
+    macros = set()
+    curdir = dirname(fname)
+    for directive, rest in _scan_directives(read_file(fname)):
+        if directive == 'define':
+            m = _ident_re.match(rest)
+            if m:
+                macros.add(m.group())
+        elif directive == 'include':
+            m = _include_re.match(rest)
+            if not m:
+                continue
+            iname = _find_include(m.group(1) or m.group(2), m.group(2) is not None,
+                                  curdir, include_paths)
+            if iname and abspath(iname) not in seen:
+                seen.add(abspath(iname))
+                macros |= _included_macros(iname, include_paths, seen)
+    return macros
+
+
+def needs_preprocessing(fname, include_paths=[], defines=[]):
     '''
-        Preprocesses the file via pcpp. Useful for dealing with files that have
-        complex macros in them, as CppHeaderParser can't deal with them
+        Quickly scans the header for anything CppHeaderParser can't deal with
+        by itself: preprocessor directives other than an include guard,
+        #include and #pragma, or uses of macros that are defined by defines
+        or by any of the files that it includes
     '''
 
-    pp = H2WPreprocessor()
+    contents = read_file(fname)
+    directives = _scan_directives(contents)
+
+    # ignore the include guard
+    if len(directives) >= 3 and directives[-1][0] == 'endif':
+        name = None
+        if directives[0][0] == 'ifndef':
+            name = directives[0][1]
+        elif directives[0][0] == 'if':
+            m = _guard_re.match(directives[0][1])
+            if m:
+                name = m.group(1)
+
+        if name and directives[1] == ('define', name):
+            directives = directives[2:-1]
+
+    for directive, _ in directives:
+        if directive not in ('include', 'pragma', ''):
+            return True
+
+    macros = set()
+    for define in defines:
+        m = _ident_re.match(define.strip())
+        if m:
+            macros.add(m.group())
+
+    seen = {abspath(fname)}
+    macros |= _included_macros(fname, include_paths, seen)
+
+    if not macros:
+        return False
+
+    text = _directive_re.sub('', contents)
+    return not macros.isdisjoint(_ident_re.findall(text))
+
+
+def _run_pcpp(fname, include_paths, defines, fast_lexer, prefetch_workers, stats,
+              source_date_epoch, comments):
+    pp = H2WPreprocessor(fast_lexer, comments)
+    pp.stats = stats
+    if source_date_epoch is not None:
+        pp.define_date(time.gmtime(source_date_epoch))
     if include_paths:
         for p in include_paths:
             pp.add_path(p)
@@ -68,24 +184,239 @@ def preprocess_file(fname, include_paths=[], retain_all_content=False, defines=[
     for define in defines:
         pp.define(define)
     
-    if not retain_all_content:
-        pp.line_directive = "#line"
-    
-    pp_content = read_file(fname)
-    pp.parse(pp_content, fname)
-    
-    if pp.errors:
-        raise PreprocessorError('\n'.join(pp.errors))
-    elif pp.return_code:
-        raise PreprocessorError('failed with exit code %d' % pp.return_code)
+    pp.line_directive = "#line"
     
+    if prefetch_workers:
+        pp.prefetcher = IncludePrefetcher(prefetch_workers)
+
+    try:
+        pp_content = read_file(fname)
+        pp.parse(pp_content, fname)
+        
+        if pp.errors:
+            raise PreprocessorError('\n'.join(pp.errors))
+        elif pp.return_code:
+            raise PreprocessorError('failed with exit code %d' % pp.return_code)
+        
+        fp = io.StringIO()
+        pp.write(fp)
+        fp.seek(0)
+    finally:
+        if pp.prefetcher:
+            pp.prefetcher.close()
+
+    deps = [t.included_abspath for t in pp.include_times if t.included_abspath]
+    return fp, deps, pp.volatile_macros
+
+
+def _directive_before(lines, lineno):
+    # the directive that ends on the line before lineno, with continuations
+    # joined, and the line it starts on
+    i = lineno - 2
+    if i < 0 or i >= len(lines):
+        return '', lineno
+    text = lines[i]
+    while i > 0 and lines[i - 1].endswith('\\'):
+        i -= 1
+        text = lines[i][:-1] + ' ' + text
+    return text, i + 1
+
+
+def _unresolved_includes(lines, include_paths):
+    # The compiler finds and inlines system headers, where pcpp passes the
+    # #include through if it can't find the file, so that CppHeaderParser
+    # lists it in includes. Returns the #include directives that pcpp would
+    # have passed through and the lines they start on, keyed by the index of
+    # the linemarker that returns from the included file.
+    stack = []      # [filename, {index: directive}] for each open file
+    sources = {}
+    for i, line in enumerate(lines):
+        if not line.startswith('# '):
+            continue
+        m = _linemarker_re.match(line)
+        if not m:
+            continue
+        lineno, name, flags = m.groups()
+        name = name.replace('\\\\', '\\')
+        flags = flags.split()
+
+        if '1' in flags:
+            stack.append([name, {}])
+        elif '2' in flags:
+            if len(stack) < 2:
+                return {}
+            _, found = stack.pop()
+            parent = stack[-1]
+            parent[0] = name
+            if name.startswith('<'):
+                continue
+
+            if name not in sources:
+                try:
+                    sources[name] = read_file(name).splitlines()
+                except (OSError, ValueError):
+                    sources[name] = []
+
+            text, start = _directive_before(sources[name], int(lineno))
+            d = _directive_re.match(text)
+            if not d or d.group(1) != 'include':
+                continue
+            inc = _include_re.match(d.group(2))
+            if not inc:
+                continue
+
+            if _find_include(inc.group(1) or inc.group(2), inc.group(2) is not None,
+                             dirname(name), include_paths):
+                # pcpp would have included the file too
+                parent[1].update(found)
+            else:
+                parent[1][i] = start, '#include ' + inc.group()
+        elif stack:
+            stack[-1][0] = name
+        else:
+            stack.append([name, {}])
+
+    return stack[0][1] if stack else {}
+
+
+def _run_compiler(compiler, fname, include_paths, defines, source_date_epoch, comments):
+    # Returns None if the compiler isn't installed
+    exe = shutil.which(compiler)
+    if exe is None:
+        return None
+
+    args = [exe, '-E', '-x', 'c++', '-Wdate-time']
+    if comments != 'none':
+        args.append('-C')
+    for p in include_paths:
+        args.append('-I' + p)
+
+    for define in defines:
+        # pcpp defines are 'NAME VALUE', and an empty value is not '1'
+        m = _define_re.match(define.strip())
+        if not m:
+            raise PreprocessorError("invalid define '%s'" % define)
+        args.append('-D%s=%s' % m.groups())
+
+    args.append(fname)
+
+    env = None
+    if source_date_epoch is not None:
+        env = dict(os.environ, SOURCE_DATE_EPOCH=str(source_date_epoch))
+
+    p = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+    stderr = p.stderr.decode('utf-8', 'replace')
+    if p.returncode:
+        raise PreprocessorError(stderr)
+
+    # -Wdate-time warns about each use of a macro that breaks reproducibility,
+    # which it doesn't when SOURCE_DATE_EPOCH is set
+    volatile = set()
+    if source_date_epoch is None:
+        for m in _date_time_re.finditer(stderr):
+            volatile.add(m.group(1) or m.group(2))
+
+    output = p.stdout.decode('utf-8', 'replace')
+    lines = output.splitlines(True)
+    includes = _unresolved_includes(lines, include_paths)
+
+    # Convert the linemarkers to #line directives naming files the same way
+    # that pcpp does, so that the output can be filtered the same way
     fp = io.StringIO()
-    pp.write(fp)
+    deps = set()
+    for i, line in enumerate(lines):
+        if line.startswith('# '):
+            m = _linemarker_re.match(line)
+            if m:
+                lineno, name, _ = m.groups()
+                name = name.replace('\\\\', '\\')
+                if not name.startswith('<'):
+                    deps.add(abspath(name))
+                    try:
+                        name = relpath(name)
+                    except Exception:
+                        pass
+                    name = name.replace('\\', '/')
+                line = '#line %s "%s"\n' % (lineno, name)
+
+                # put back the #include, on the line it was on
+                if i in includes:
+                    fp.write('#line %d "%s"\n%s\n' % (includes[i][0], name, includes[i][1]))
+        fp.write(line)
     fp.seek(0)
+
+    return fp, sorted(deps), volatile
+
+
+def preprocess_file(fname, include_paths=[], retain_all_content=False, defines=[],
+                    fast_lexer=True, cache=None, backend='pcpp', prefetch_workers=0,
+                    stats=None, source_date_epoch=None, volatile=None, comments='all'):
+    '''
+        Preprocesses the file via pcpp. Useful for dealing with files that have
+        complex macros in them, as CppHeaderParser can't deal with them
+
+        If fast_lexer is False, pcpp's generic ply lexer is used instead of
+        the specialized tokenizer
+
+        If cache is a :class:`.PreprocessCache`, the output is loaded from it
+        when none of the files that were included last time have changed
+
+        backend may be 'gcc' or 'clang' to run the compiler's preprocessor
+        instead, which is much faster on deep include trees. Unlike pcpp, the
+        compiler's predefined macros are set and missing includes are an
+        error. If the compiler isn't installed, pcpp is used.
+
+        If prefetch_workers is set, pcpp reads included files on that many
+        background threads ahead of when it needs them
+
+        If stats is a :class:`.PreprocessorStats`, pcpp adds its token, macro,
+        expression and include cache counts to it
+
+        If source_date_epoch is set, __DATE__ and __TIME__ are defined from
+        it instead of the current time (or SOURCE_DATE_EPOCH from the
+        environment) so that the output is reproducible
+
+        If volatile is a set, the names of the macros that make the output
+        differ from run to run are added to it. Output that uses them is never
+        cached.
+
+        comments may be 'doxygen' to only keep the text of the comments that
+        CppHeaderParser reads documentation from (the others are emptied), or
+        'none' to remove all of them. The compiler backends can only keep all
+        comments or none.
+    '''
+
+    if cache is not None:
+        epoch = source_date_epoch
+        if epoch is None:
+            epoch = os.environ.get('SOURCE_DATE_EPOCH')
+        options = [include_paths, retain_all_content, defines, backend, epoch, comments]
+        contents = cache.get(fname, options)
+        if contents is not None:
+            return contents
+
+    result = None
+    if backend != 'pcpp':
+        result = _run_compiler(backend, fname, include_paths, defines, source_date_epoch,
+                               comments)
+
+    if result is None:
+        result = _run_pcpp(fname, include_paths, defines, fast_lexer, prefetch_workers, stats,
+                           source_date_epoch, comments)
+
+    fp, deps, used = result
     if retain_all_content:
-        return fp.read()
+        contents = fp.read()
     else:
-        return _filter_self(fname, fp)
+        contents = _filter_self(fname, fp)
+
+    if volatile is not None:
+        volatile.update(used)
+
+    if cache is not None and not used:
+        cache.put(fname, options, deps, contents)
+
+    return contents
 
 
 if __name__ == '__main__':
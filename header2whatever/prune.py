@@ -0,0 +1,139 @@
+'''
+    Removes the parts of the parsed headers that templates don't use, so
+    that they don't take up memory (or space in a model file) until
+    rendering is done.
+
+    The fields to keep are given for each kind of object:
+
+    - header: attributes of the header objects
+    - class: keys (and attributes, such as base_classes) of classes
+    - method: keys of functions and methods
+    - variable: keys of variables, class properties and parameters
+    - enum: keys of enums
+
+    Kinds that aren't listed are kept as they are, though the objects in
+    them are still pruned: for example, if only 'method' is listed, every
+    class is kept but its methods only have the listed keys.
+'''
+
+_kinds = ('header', 'class', 'method', 'variable', 'enum')
+
+_access = ('public', 'protected', 'private')
+
+
+class _Pruner:
+    def __init__(self, fields):
+        self.fields = {k: frozenset(v) for k, v in fields.items()}
+        self.seen = set()
+
+    def _keys(self, kind, obj):
+        keep = self.fields.get(kind)
+        if keep is not None:
+            for k in [k for k in obj if k not in keep]:
+                del obj[k]
+
+    def header(self, header):
+        if id(header) in self.seen:
+            return
+        self.seen.add(id(header))
+
+        keep = self.fields.get('header')
+        if keep is not None:
+            for k in [k for k in vars(header) if k not in keep]:
+                delattr(header, k)
+
+        self.contents(header)
+
+        by_file = getattr(header, 'by_file', None)
+        if by_file:
+            for contents in by_file.values():
+                self.contents(contents)
+
+    def contents(self, obj):
+        # the attributes of a header (or of a FileContents)
+        for attr in ('classes', 'all_classes', 'classes_order'):
+            self.classes(getattr(obj, attr, None))
+        for attr in ('functions', 'all_functions'):
+            self.each(self.method, getattr(obj, attr, None))
+        for attr in ('enums', 'all_enums'):
+            self.each(self.enum, getattr(obj, attr, None))
+        for attr in ('global_enums', 'all_global_enums'):
+            enums = getattr(obj, attr, None)
+            if enums:
+                self.each(self.enum, enums.values())
+        for attr in ('variables', 'all_variables'):
+            self.each(self.variable, getattr(obj, attr, None))
+
+    def classes(self, classes):
+        if isinstance(classes, dict):
+            classes = classes.values()
+        self.each(self.cls, classes)
+
+    def each(self, fn, items):
+        if items:
+            for item in items:
+                fn(item)
+
+    def by_access(self, fn, d):
+        if isinstance(d, dict):
+            for access in _access:
+                self.each(fn, d.get(access))
+
+    def cls(self, cls):
+        if id(cls) in self.seen:
+            return
+        self.seen.add(id(cls))
+
+        self.by_access(self.method, cls.get('methods'))
+        self.by_access(self.variable, cls.get('properties'))
+        self.by_access(self.enum, cls.get('enums'))
+        self.each(self.cls, cls.get('nested_classes'))
+
+        self._keys('class', cls)
+
+        # h2w adds the class hierarchy as attributes
+        keep = self.fields.get('class')
+        if keep is not None:
+            for k in ('base_classes', 'derived_classes', 'ancestors'):
+                if k not in keep and hasattr(cls, k):
+                    delattr(cls, k)
+
+    def method(self, fn):
+        if id(fn) in self.seen:
+            return
+        self.seen.add(id(fn))
+
+        self.each(self.variable, fn.get('parameters'))
+        self._keys('method', fn)
+
+    def variable(self, var):
+        if id(var) not in self.seen:
+            self.seen.add(id(var))
+            self._keys('variable', var)
+
+    def enum(self, enum):
+        if id(enum) not in self.seen:
+            self.seen.add(id(enum))
+            self._keys('enum', enum)
+
+
+def prune_headers(headers, fields, symbols=None):
+    '''
+        Removes the fields that aren't listed in fields (a dict of lists of
+        names, keyed by kind) from the headers and the objects in them, and
+        from the objects in symbols (a :class:`.SymbolIndex`)
+    '''
+    for kind in fields:
+        if kind not in _kinds:
+            raise ValueError("unknown kind '%s' in fields (expected one of %s)"
+                             % (kind, ', '.join(_kinds)))
+
+    pruner = _Pruner(fields)
+    for header in headers:
+        pruner.header(header)
+
+    if symbols is not None:
+        pruner.classes(symbols.classes)
+        pruner.each(pruner.enum, symbols.enums.values())
+        for overloads in symbols.functions.values():
+            pruner.each(pruner.method, overloads)
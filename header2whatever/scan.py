@@ -0,0 +1,334 @@
+'''
+    Quick scans over the text of a header, for work that can be done before
+    handing it to the parser. These only look at tokens and braces, they
+    don't parse declarations.
+'''
+
+from fnmatch import fnmatchcase
+import re
+
+token_re = re.compile(
+    r'''(?P<comment>//[^\n]*|/\*.*?\*/)'''
+    r'''|(?P<skip>'(?:[^'\\\n]|\\.)*'|[ \t\r\f\v]+)'''
+    r'''|(?P<pp>^[ \t]*\#(?:\\\n|[^\n])*)'''
+    r'''|(?P<nl>\n)'''
+    r'''|(?P<tok>::|[A-Za-z_]\w*|"(?:[^"\\\n]|\\.)*"|.)''',
+    re.M | re.S,
+)
+
+# if one of these is in a declaration, a { after it isn't a function body
+_not_function = frozenset(('class', 'struct', 'union', 'enum', 'namespace', 'extern', '='))
+
+# parens after one of these aren't a parameter list
+_not_parameters = frozenset(('alignas', '__attribute__', '__declspec', 'decltype'))
+
+# a { after a declaration with one of these opens a scope that may contain
+# function definitions
+_scopes = frozenset(('class', 'struct', 'union', 'namespace', 'extern'))
+
+
+def strip_function_bodies(contents):
+    '''
+        Replaces the bodies of functions and methods defined in a header with
+        an empty {}, keeping the newlines and preprocessor lines (such as the
+        #line directives pcpp emits) so that line numbers don't change.
+        Class bodies, enums and initializers are left alone. Returns
+        contents unchanged if its braces don't balance.
+    '''
+    out = []
+    last = 0
+
+    # for each open brace, whether functions can be defined inside it
+    stack = []
+
+    parens = 0
+    stmt = []
+    body_start = None
+    body_depth = 0
+    init_list = False
+
+    for m in token_re.finditer(contents):
+        if m.lastgroup != 'tok':
+            continue
+        tok = m.group()
+
+        if body_start is not None:
+            if tok == '{':
+                body_depth += 1
+            elif tok == '}':
+                body_depth -= 1
+                if not body_depth:
+                    out.append(contents[last:body_start])
+                    out.append(_blank(contents[body_start:m.start()]))
+                    last = m.start()
+                    body_start = None
+            continue
+
+        if tok in ('(', '[') or (tok == '{' and (parens or init_list and stmt[-1] not in (')', '}'))):
+            # braces in parens, or a member initialized with x{1}
+            parens += 1
+            stmt.append(tok)
+        elif tok in (')', ']') or (tok == '}' and parens):
+            parens -= 1
+            stmt.append(tok)
+        elif parens:
+            stmt.append(tok)
+        elif tok == ';':
+            stmt = []
+            init_list = False
+        elif tok == '{':
+            if all(stack) and _is_function(stmt):
+                body_start = m.end()
+                body_depth = 1
+            else:
+                stack.append(_is_scope(stmt))
+            stmt = []
+            init_list = False
+        elif tok == '}':
+            if not stack:
+                return contents
+            stack.pop()
+            stmt = []
+        elif tok == ':' and stmt and stmt[-1] == ')':
+            # constructor initializer list
+            init_list = True
+            stmt.append(tok)
+        else:
+            stmt.append(tok)
+
+    if body_start is not None or stack or parens:
+        return contents
+
+    out.append(contents[last:])
+    return ''.join(out)
+
+
+# comments that CppHeaderParser collects as doxygen start with these
+doxygen_prefixes = ('///', '//!', '/**', '/*!')
+
+
+def strip_doxygen(contents):
+    '''
+        Turns doxygen comments into plain comments, so that CppHeaderParser
+        doesn't collect them. The comments themselves are kept, as they
+        change the line numbers CppHeaderParser gives some declarations.
+    '''
+    out = []
+    last = 0
+    for m in token_re.finditer(contents):
+        if m.lastgroup == 'comment':
+            text = m.group()
+            if text.startswith(doxygen_prefixes):
+                out.append(contents[last:m.start()])
+                out.append(text[:2] + ' ' + text[3:] if text != '/**/' else '/* */')
+                last = m.end()
+    out.append(contents[last:])
+    return ''.join(out)
+
+
+def _top_level(stmt):
+    # yields the tokens of a declaration that aren't in parens or template
+    # arguments (and the opening parens, except those of attributes and
+    # decltype), and skips the name of an operator
+    parens = angle = 0
+    prev = None
+    operator = False
+    for tok in stmt:
+        if operator:
+            operator = tok != '('
+            if operator:
+                prev = tok
+                continue
+        if tok == '(':
+            if not parens and not angle and prev not in _not_parameters:
+                yield tok
+            parens += 1
+        elif tok == ')':
+            parens -= 1
+        elif not parens and tok == '<':
+            angle += 1
+        elif not parens and tok == '>' and prev != '-':
+            angle -= 1
+        elif not parens and not angle:
+            if tok == 'operator':
+                operator = True
+            yield tok
+        prev = tok
+
+
+def _is_function(stmt):
+    toks = list(_top_level(stmt))
+    return '(' in toks and not any(tok in _not_function for tok in toks)
+
+
+def _is_scope(stmt):
+    return any(tok in _scopes for tok in _top_level(stmt))
+
+
+_class_keys = ('class', 'struct', 'union')
+
+
+def _blank(text):
+    # keeps preprocessor lines (#line directives) and newlines
+    return ''.join(m.group() if m.lastgroup == 'pp' else '\n' * m.group().count('\n')
+                   for m in token_re.finditer(text))
+
+
+def strip_template(words):
+    '''template <class T> struct X -> struct X'''
+    if words[:2] != ['template', '<']:
+        return words
+    depth = 0
+    for i, w in enumerate(words):
+        if w == '<':
+            depth += 1
+        elif w == '>':
+            depth -= 1
+            if not depth:
+                return words[i + 1:]
+    return words
+
+
+def _class_name(words):
+    '''
+        The name of the class defined by words, such as Foo in
+        class API alignas(8) Foo final : Base, or '' if it's anonymous
+    '''
+    i = min(words.index(k) for k in _class_keys if k in words)
+    name = ''
+    depth = 0
+    for w in words[i + 1:]:
+        # skip attributes and template arguments
+        if w in ('(', '[', '<'):
+            depth += 1
+        elif w in (')', ']', '>'):
+            depth -= 1
+        elif depth:
+            continue
+        elif w in (':', 'final'):
+            break
+        elif re.match(r'[A-Za-z_]', w):
+            name = w
+    return name
+
+
+def select_declarations(contents, classes=None, namespaces=None):
+    '''
+        Removes the top level declarations that weren't selected, replacing
+        them with their newlines so that line numbers don't change. classes
+        and namespaces are lists of names or fnmatch patterns:
+
+        - a class (or struct/union) definition is kept if its name or its
+          qualified name (ns::Name) matches one of classes
+        - any declaration is kept if it's in a namespace that matches one
+          of namespaces, or is nested inside one that does
+
+        Typedefs, using declarations and forward declarations are always
+        kept, so that types used by the selected classes resolve the same
+        way. Returns contents unchanged if its braces don't balance.
+    '''
+    classes = classes or []
+    namespaces = namespaces or []
+
+    out = []
+    seg_start = 0
+
+    # ('ns', names), ('class', None), ('body', None) for function bodies or
+    # ('other', None) for enums and initializers
+    stack = []
+    path = []
+    parens = 0
+    stmt = []
+
+    # the class defined by the current declaration (if any), and the name
+    # given to it by typedef struct { ... } Name
+    decl_class = None
+    decl_alias = None
+    after_class = False
+
+    def _in_namespace():
+        return any(fnmatchcase('::'.join(path[:i]), pat)
+                   for i in range(1, len(path) + 1) for pat in namespaces)
+
+    def _end(end, keep):
+        nonlocal seg_start, decl_class, decl_alias, after_class
+        text = contents[seg_start:end]
+        out.append(text if keep else _blank(text))
+        seg_start = end
+        decl_class = decl_alias = None
+        after_class = False
+
+    def _keep(words):
+        if _in_namespace():
+            return True
+        if decl_class is not None:
+            names = [n for n in (decl_class, decl_alias) if n]
+            names += ['::'.join(path + [n]) for n in names]
+            return any(fnmatchcase(n, pat) for n in names for pat in classes)
+        words = strip_template(words)
+        if words[:1] in (['typedef'], ['using']):
+            return True
+        return len(words) == 2 and words[0] in _class_keys
+
+    for m in token_re.finditer(contents):
+        if m.lastgroup != 'tok':
+            continue
+        tok = m.group()
+        top = all(k == 'ns' for k, _ in stack)
+
+        if tok == '(' or tok == '[':
+            parens += 1
+            stmt.append(tok)
+        elif tok == ')' or tok == ']':
+            parens -= 1
+            stmt.append(tok)
+        elif parens:
+            stmt.append(tok)
+        elif tok == ';':
+            if top:
+                _end(m.end(), _keep(stmt))
+            stmt = []
+        elif tok == '{':
+            words = strip_template([t for t in stmt if t != 'typedef'])
+            if not top:
+                stack.append(('other', None))
+            elif words[:1] == ['namespace'] or words[:2] == ['inline', 'namespace'] or \
+                    (words[:1] == ['extern'] and len(words) == 2):
+                names = [t for t in words if t not in ('inline', 'namespace', '::', 'extern')
+                         and not t.startswith('"')]
+                stack.append(('ns', names))
+                path.extend(names)
+                _end(m.end(), True)
+            elif _is_function(stmt):
+                stack.append(('body', None))
+            elif any(k in words for k in _class_keys) and 'enum' not in words and '=' not in words:
+                stack.append(('class', None))
+                decl_class = _class_name(words)
+            else:
+                stack.append(('other', None))
+            stmt = []
+        elif tok == '}':
+            if not stack:
+                return contents
+            kind, names = stack.pop()
+            if kind == 'ns':
+                del path[len(path) - len(names):]
+                _end(m.start(), False)
+                _end(m.end(), True)
+            elif kind == 'body' and all(k == 'ns' for k, _ in stack):
+                _end(m.end(), _keep(stmt))
+            elif kind == 'class' and all(k == 'ns' for k, _ in stack):
+                after_class = True
+            stmt = []
+        else:
+            if after_class:
+                if re.match(r'[A-Za-z_]', tok):
+                    decl_alias = tok
+                after_class = False
+            stmt.append(tok)
+
+    if stack or parens:
+        return contents
+
+    _end(len(contents), False)
+    return ''.join(out)
@@ -0,0 +1,195 @@
+def _qualify(namespace, name):
+    # CppHeaderParser isn't consistent about whether namespaces end with ::
+    namespace = namespace.rstrip(':')
+    if namespace:
+        return namespace + '::' + name
+    return name
+
+
+def _class_name(cls):
+    # CppHeaderParser puts the parent class in the namespace of a nested
+    # class, but not consistently (it's repeated for deeper nesting), so
+    # nested classes are qualified by their parent instead
+    parent = cls.get('parent')
+    if parent:
+        return _class_name(parent) + '::' + cls['name']
+    return _qualify(cls['namespace'], cls['name'])
+
+
+class FileContents:
+    '''The classes, functions, enums and variables declared in a single file'''
+
+    def __init__(self):
+        self.classes = []
+        self.functions = []
+        self.enums = []
+        self.global_enums = {}
+        self.variables = []
+
+
+class SymbolIndex:
+    '''
+        Classes, enums, typedefs and functions from every header that was
+        processed, keyed by their fully qualified name (without a leading
+        ::). Nested classes and enums are qualified by their parent class.
+
+        - classes: the class dicts
+        - enums: the enum dicts. Anonymous enums aren't included.
+        - typedefs: the name of the type that the typedef or alias refers to
+        - functions: a list of the overloads of each free function
+        - headers: the header that each of the above was found in
+    '''
+
+    def __init__(self):
+        self.classes = {}
+        self.enums = {}
+        self.typedefs = {}
+        self.functions = {}
+        self.headers = {}
+
+    def add_header(self, header):
+        '''
+            Adds the declarations in a header. When the contents of included
+            files are retained, only those from the header itself are added.
+        '''
+        headers = self.headers
+
+        for cls in header.classes:
+            name = _class_name(cls)
+            self.classes[name] = cls
+            headers[name] = header
+
+            for access in ('public', 'protected', 'private'):
+                for enum in cls['enums'][access]:
+                    if enum.get('name'):
+                        ename = name + '::' + enum['name']
+                        self.enums[ename] = enum
+                        headers[ename] = header
+
+        for enum in header.enums:
+            if enum.get('name'):
+                name = _qualify(enum['namespace'], enum['name'])
+                self.enums[name] = enum
+                headers[name] = header
+
+        for name, target in header.typedefs.items():
+            self.typedefs[name] = target
+            headers[name] = header
+
+        for name, alias in header.using.items():
+            if alias.get('using_type') == 'typealias':
+                name = _qualify(alias['namespace'], name)
+                self.typedefs[name] = alias['raw_type']
+                headers[name] = header
+
+        for fn in header.functions:
+            name = _qualify(fn['namespace'], fn['name'])
+            self.functions.setdefault(name, []).append(fn)
+            headers[name] = header
+
+    def find_class(self, name, scope=''):
+        '''
+            Returns the class that name refers to when it is used in scope
+            (a namespace or class name), or None. Enclosing scopes are
+            searched from the innermost outwards, and typedefs are followed.
+        '''
+        seen = set()
+        while True:
+            if name.startswith('::'):
+                candidates = [name[2:]]
+            else:
+                parts = scope.rstrip(':').split('::') if scope else []
+                candidates = ['::'.join(parts[:i] + [name]) for i in range(len(parts), -1, -1)]
+
+            for candidate in candidates:
+                cls = self.classes.get(candidate)
+                if cls is not None:
+                    return cls
+
+            for candidate in candidates:
+                target = self.typedefs.get(candidate)
+                if target is not None and candidate not in seen:
+                    seen.add(candidate)
+                    name = target
+                    scope = candidate.rpartition('::')[0]
+                    break
+            else:
+                return None
+
+    def resolve_hierarchy(self):
+        '''
+            Resolves the base classes of every class in the index, and sets
+            the following attributes on each class (they aren't dict items,
+            so dumping a class doesn't recurse through the hierarchy):
+
+            - base_classes: the classes it inherits from that could be found
+            - derived_classes: the classes that directly inherit from it
+            - ancestors: all of its (found) base classes in C3 linearization
+              order, or depth first order if there isn't one
+        '''
+        classes = list(self.classes.values())
+        for cls in classes:
+            cls.derived_classes = []
+
+        for cls in classes:
+            # bases are looked up from the scope the class is declared in
+            parent = cls.get('parent')
+            scope = _class_name(parent) if parent else cls['namespace']
+
+            bases = []
+            for inherit in cls['inherits']:
+                base = self.find_class(inherit['decl_name'], scope)
+                if base is not None and base is not cls:
+                    bases.append(base)
+                    base.derived_classes.append(cls)
+            cls.base_classes = bases
+
+        for cls in classes:
+            _linearize(cls, set())
+
+
+def _linearize(cls, visiting):
+    ancestors = getattr(cls, 'ancestors', None)
+    if ancestors is not None:
+        return ancestors
+
+    if id(cls) in visiting:
+        # inheritance cycle, which can only come from a name resolution
+        # mixup; don't recurse forever
+        return []
+    visiting.add(id(cls))
+
+    bases = cls.base_classes
+    sequences = [[b] + _linearize(b, visiting) for b in bases]
+    ancestors = _c3_merge([list(s) for s in sequences] + [list(bases)])
+    if ancestors is None:
+        ancestors = []
+        for s in sequences:
+            for b in s:
+                if not any(b is a for a in ancestors):
+                    ancestors.append(b)
+
+    visiting.discard(id(cls))
+    cls.ancestors = ancestors
+    return ancestors
+
+
+def _c3_merge(sequences):
+    # Returns None if there isn't a consistent linearization
+    result = []
+    while True:
+        sequences = [s for s in sequences if s]
+        if not sequences:
+            return result
+
+        for s in sequences:
+            head = s[0]
+            if not any(head is c for other in sequences for c in other[1:]):
+                break
+        else:
+            return None
+
+        result.append(head)
+        for s in sequences:
+            if s[0] is head:
+                del s[0]
@@ -1,7 +1,9 @@
 
 import collections
+import os
 import os.path
 import sys
+import tempfile
 
 import yaml
 
@@ -38,6 +40,32 @@ def read_file(fname):
 
     return contents
 
+# mkstemp creates files that only the owner can read, so the permissions a
+# file would normally get are set on it. The umask can only be read by
+# setting it, which isn't safe once other threads are running
+_umask = os.umask(0)
+os.umask(_umask)
+
+def write_atomic(fname, contents):
+    '''
+        Writes contents to fname via a temporary file in the same directory,
+        so that readers (and other threads or processes writing it) never
+        see a partially written file
+    '''
+    fd, tmpname = tempfile.mkstemp(dir=os.path.dirname(fname) or '.',
+                                   prefix=os.path.basename(fname) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as fp:
+            fp.write(contents)
+        os.chmod(tmpname, 0o666 & ~_umask)
+        os.replace(tmpname, fname)
+    except BaseException:
+        try:
+            os.unlink(tmpname)
+        except OSError:
+            pass
+        raise
+
 _mapping_tag = yaml.resolver.BaseResolver.DEFAULT_MAPPING_TAG
 
 def dict_constructor(loader, node):
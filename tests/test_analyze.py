@@ -0,0 +1,50 @@
+import pytest
+
+from header2whatever.config import Config, Template
+from header2whatever.parse import process_config
+
+header = '''
+class Foo {
+public:
+    /** Does something */
+    void bar(int x);
+    int y;
+};
+'''
+
+templates = {
+    # a key that isn't constant, read from a macro argument
+    'lookup': "{% macro f(c, key) %}{{ c[key] }}{% endmacro %}"
+              "{{ f(cls, 'line_number') }}",
+
+    # the keys of a macro argument
+    'keys': "{% macro d(c) %}{% for k in c.keys()|sort %}{{k}} {% endfor %}"
+            "{% endmacro %}{{ d(cls) }}",
+
+    'items': "{% macro d(c) %}{% for k, v in c|dictsort %}{{k}} {% endfor %}"
+             "{% endmacro %}{{ d(cls) }}",
+
+    'text': "{% macro d(c) %}{{ c.methods.public[0].keys()|list|sort }}"
+            "{% endmacro %}{{ d(cls) }}",
+}
+
+
+def _render(tmp_path, src, analyze):
+    (tmp_path / 'h.h').write_text(header)
+    (tmp_path / 't.j2').write_text(src)
+    out = tmp_path / ('analyzed.txt' if analyze else 'out.txt')
+
+    cfg = Config()
+    cfg.headers = [str(tmp_path / 'h.h')]
+    cfg.class_templates = [Template({'src': str(tmp_path / 't.j2'), 'dst': str(out)})]
+    cfg.analyze_templates = analyze
+    cfg.validate()
+
+    process_config(cfg)
+    return out.read_text()
+
+
+@pytest.mark.parametrize('name', sorted(templates))
+def test_unknown_values_are_kept(tmp_path, name):
+    expected = _render(tmp_path, templates[name], False)
+    assert _render(tmp_path, templates[name], True) == expected
@@ -0,0 +1,81 @@
+import io
+
+from header2whatever import chunked
+from header2whatever.config import Config
+from header2whatever.dump import dump_json
+from header2whatever.parse import parse_config
+
+
+def _header():
+    parts = ['#pragma once\n#include <stdint.h>\n']
+    for i in range(12):
+        parts.append('''
+namespace ns%(i)d {
+namespace inner {
+
+/// Class %(i)d
+class C%(i)d : public Base%(i)d {
+public:
+    C%(i)d();
+    /** method */
+    int m(int x, const char *s = "}") const;
+    enum { AnonValue%(i)d = %(i)d };
+    struct { int a; } anon_member;
+private:
+    int v;
+};
+
+}
+
+enum E%(i)d { A%(i)d, B%(i)d = 3 };
+typedef struct { int x; } S%(i)d;
+using Alias%(i)d = inner::C%(i)d;
+template <typename T> struct T%(i)d { T t; };
+
+int function%(i)d(double d);
+extern int variable%(i)d;
+
+}
+
+extern "C" {
+void c_function%(i)d(void);
+}
+
+class Base%(i)d { public: virtual ~Base%(i)d(); };
+enum { GlobalAnon%(i)d };
+inline int inline%(i)d() { return %(i)d; }
+''' % {'i': i})
+    return ''.join(parts)
+
+
+def _dump(path, workers):
+    cfg = Config()
+    cfg.headers = [str(path)]
+    cfg.parse_workers = workers
+    cfg.parse_chunk_lines = 40
+    cfg.validate()
+    model = parse_config(cfg)
+    fp = io.StringIO()
+    dump_json(model['headers'], fp)
+    return fp.getvalue()
+
+
+def test_chunked_matches(tmp_path, monkeypatch):
+    path = tmp_path / 'big.h'
+    path.write_text(_header())
+
+    merged = []
+    merge = chunked._merge
+
+    def counting_merge(parts):
+        merged.append(len(parts))
+        return merge(parts)
+
+    monkeypatch.setattr(chunked, '_merge', counting_merge)
+
+    single = _dump(path, 0)
+    assert not merged
+
+    assert _dump(path, 3) == single
+    # make sure that it was parsed in parts, rather than falling back
+    assert merged and merged[0] > 2
@@ -0,0 +1,101 @@
+'''
+    FastLexer must produce exactly the tokens that pcpp's generic ply lexer
+    does, so the same inputs are fed to both and the results compared.
+'''
+
+import random
+import string
+
+import pytest
+
+from header2whatever._pcpp import FastLexer, Preprocessor
+
+corpus = [
+    '',
+    '\n',
+    'int x;',
+    '#include <foo/bar.h>\n#include "baz.h"\n',
+    '#define MAX(a, b) ((a) > (b) ? (a) : (b))\n',
+    '#define STR(x) #x\n#define CAT(a, b) a ## b\n',
+    '#if defined(FOO) && FOO >= 2 || !BAR\n#elif X<<1 != 3\n#endif\n',
+    'x = 1; y = 0x1F; z = 017; w = 10u; v = 10UL; u = 1000000000000LL;\n',
+    'f = 1.0; g = .5; h = 1.; i = 1e10; j = 1.5e-3f; k = 0x1p3; l = 3.14L;\n',
+    's = "a\\"b\\\\"; t = L"wide"; u = u8"x"; c = \'a\'; d = \'\\n\'; e = \'\\\'\';\n',
+    '"unterminated\nnext line\n',
+    '\'x\n',
+    '/* block\n   comment */ int a; // line comment\nint b;\n',
+    '/** doxygen\n * @brief x\n */\nvoid f();\n',
+    '/* unterminated comment\n',
+    'a->b; a->*b; a.*b; a::b; ...; a<=>b;\n',
+    'a += 1; a -= 1; a *= 1; a /= 1; a %= 1; a &= 1; a |= 1; a ^= 1; a <<= 1; a >>= 1;\n',
+    'a++; a--; ~a; !a; a && b; a || b; a == b; a != b; a <= b; a >= b;\n',
+    'x = a ? b : c; arr[0] = {1, 2};\n',
+    '#define LONG a \\\n    b \\\n    c\nint after;\n',
+    'line1\r\nline2\r\n',
+    '\tint\ttabs;\f\v\n',
+    '@ $ ` \x00 \x7f\n',
+    'int caf\u00e9 = 1; const char *s = "\u00fc\u00f1\u00ee\u00e7\u00f8d\u00e9";\n',
+    '??= ??/ ??( ??)\n',
+    'no trailing newline',
+    '\n\n\n   \n',
+]
+
+# pieces that random snippets are made of
+_pieces = [
+    'int', 'x', '_id9', '0', '42', '0x1f', '1.5', '.5e3', '1e', '0b101', '3.',
+    '"str"', '"a\\"b"', '"', "'c'", "'\\''", "'",
+    '/*', '*/', '//', '/* c */', '// c\n',
+    '#', '##', '#define', '#include', '\\', '\\\n',
+    '(', ')', '[', ']', '{', '}', ';', ',', ':', '::', '?', '.', '...',
+    '+', '-', '*', '/', '%', '&', '|', '^', '~', '!', '=', '<', '>',
+    '<<', '>>', '->', '++', '--', '&&', '||', '==', '!=', '<=', '>=',
+    ' ', '  ', '\t', '\n', '\r\n', '\n\n',
+]
+
+
+def _random_snippets(count, seed):
+    rng = random.Random(seed)
+    for _ in range(count):
+        parts = []
+        for _ in range(rng.randint(1, 40)):
+            if rng.random() < 0.1:
+                parts.append(rng.choice(string.printable))
+            else:
+                parts.append(rng.choice(_pieces))
+        yield ''.join(parts)
+
+
+inputs = corpus + list(_random_snippets(500, 26))
+
+
+def _tokens(lexer, text):
+    lexer.input(text)
+    lexer.lineno = 1
+    result = []
+    while True:
+        tok = lexer.token()
+        if tok is None:
+            return result
+        result.append((tok.type, tok.value, tok.lineno, tok.lexpos))
+
+
+def _lines(pp, text):
+    return [[(tok.type, tok.value, tok.lineno, tok.source) for tok in line]
+            for line in pp.group_lines(text, 'src.h')]
+
+
+@pytest.fixture(scope='module')
+def preprocessors():
+    return Preprocessor(), Preprocessor(FastLexer())
+
+
+@pytest.mark.parametrize('text', inputs)
+def test_tokens(preprocessors, text):
+    ply_pp, fast_pp = preprocessors
+    assert _tokens(fast_pp.lexer.clone(), text) == _tokens(ply_pp.lexer.clone(), text)
+
+
+@pytest.mark.parametrize('text', inputs)
+def test_lines(preprocessors, text):
+    ply_pp, fast_pp = preprocessors
+    assert _lines(fast_pp, text) == _lines(ply_pp, text)
@@ -0,0 +1,118 @@
+'''
+    Replaying a recorded #include must give the same output and leave the
+    same macros defined as preprocessing the file again.
+'''
+
+import io
+
+import pytest
+
+from header2whatever._pcpp import PreprocessorStats
+from header2whatever.preprocess import H2WPreprocessor
+
+files = {
+    # no include guard, so it's preprocessed again each time
+    'defs.h': '''
+#if VALUE == 1
+int one;
+#elif defined(EXTRA)
+int extra_value = EXTRA;
+#else
+int other_value = VALUE;
+#endif
+#define SEEN_DEFS SEEN_DEFS_VALUE
+#define SEEN_DEFS_VALUE VALUE
+int value = VALUE;
+''',
+    'guarded.h': '''
+#ifndef GUARDED_H
+#define GUARDED_H
+struct G { int g; };
+#endif
+''',
+    'once.h': '''
+#pragma once
+struct Once {};
+''',
+    'set2.h': '''
+#undef VALUE
+#define VALUE 2
+''',
+    'nested.h': '''
+#include "defs.h"
+#include "guarded.h"
+int nested = SEEN_DEFS;
+''',
+    'counter.h': '''
+int counter = __COUNTER__;
+''',
+    'plain.h': '''
+int plain = VALUE;
+''',
+    'fn.h': '''
+#define CALL(x) call_##x(VALUE)
+int CALL(fn);
+''',
+}
+
+main = '''
+#define VALUE 1
+#include "defs.h"
+#include "defs.h"
+#include "guarded.h"
+#include "guarded.h"
+#include "once.h"
+#include "once.h"
+#include "fn.h"
+#include "plain.h"
+#include "plain.h"
+#include "nested.h"
+#include "set2.h"
+#include "plain.h"
+#include "defs.h"
+#include "nested.h"
+#define EXTRA 3
+#include "defs.h"
+#undef EXTRA
+#include "defs.h"
+#include "fn.h"
+#include "counter.h"
+#include "counter.h"
+#include <missing.h>
+int end = SEEN_DEFS + VALUE;
+'''
+
+
+def _preprocess(path, cache_includes):
+    pp = H2WPreprocessor()
+    pp.cache_includes = cache_includes
+    pp.stats = PreprocessorStats()
+    pp.line_directive = '#line'
+    pp.add_path(str(path))
+    pp.parse(main, str(path / 'main.h'))
+    fp = io.StringIO()
+    pp.write(fp)
+
+    macros = sorted((name, ''.join(t.value for t in m.value), m.arglist)
+                    for name, m in pp.macros.items() if name not in ('__DATE__', '__TIME__'))
+    return fp.getvalue(), macros, pp.errors, pp.stats
+
+
+@pytest.fixture
+def path(tmp_path):
+    for name, text in files.items():
+        (tmp_path / name).write_text(text)
+    return tmp_path
+
+
+def test_replay_matches(path):
+    output, macros, errors, _ = _preprocess(path, False)
+    cached_output, cached_macros, cached_errors, stats = _preprocess(path, True)
+
+    assert cached_output == output
+    assert cached_macros == macros
+    assert cached_errors == errors == []
+
+    # make sure that something was actually replayed
+    hits = sum(s['cache_hits'] for s in stats.includes.values())
+    assert hits >= 3
@@ -0,0 +1,115 @@
+import os
+
+import jinja2
+import pytest
+
+from header2whatever.config import Config, Template
+from header2whatever.parse import process_config
+
+header = '''
+class Base { public: void b(); };
+class Derived : public Base { public: void d(); };
+class Other { public: void o(); };
+class Skipped { public: void s(); };
+'''
+
+template = '''{% if cls.name == 'Skipped' %}{{ skip_generation() }}{% endif %}
+{{ cls.name }}: {% for m in cls.methods.public %}{{ m.name }} {% endfor %}
+'''
+
+
+@pytest.fixture
+def run(tmp_path, monkeypatch):
+    (tmp_path / 'h.h').write_text(header)
+    (tmp_path / 'cls.j2').write_text(template)
+    (tmp_path / 'out').mkdir()
+
+    rendered = []
+    render = jinja2.Template.render
+
+    def counting_render(self, *args, **kwargs):
+        if self.name == 'cls.j2':
+            rendered.append(kwargs['cls']['name'])
+        return render(self, *args, **kwargs)
+
+    monkeypatch.setattr(jinja2.Template, 'render', counting_render)
+
+    def run():
+        cfg = Config()
+        cfg.headers = [str(tmp_path / 'h.h')]
+        cfg.class_templates = [Template({'src': str(tmp_path / 'cls.j2'),
+                                         'dst': str(tmp_path / 'out' / '{{ cls.name }}.txt')})]
+        cfg.class_manifest = str(tmp_path / 'out' / 'manifest.json')
+        cfg.validate()
+
+        before = _mtimes(tmp_path / 'out')
+        del rendered[:]
+        process_config(cfg)
+        after = _mtimes(tmp_path / 'out')
+        written = sorted(f for f in after if f != 'manifest.json' and before.get(f) != after[f])
+        return sorted(rendered), written
+
+    return run
+
+
+def _mtimes(path):
+    # outputs are replaced when they're written, so the inode changes even
+    # if the mtime doesn't
+    result = {}
+    for f in os.listdir(str(path)):
+        st = os.stat(str(path / f))
+        result[f] = st.st_ino, st.st_mtime_ns
+    return result
+
+
+def _edit(tmp_path, old, new):
+    fname = tmp_path / 'h.h'
+    fname.write_text(fname.read_text().replace(old, new))
+
+
+everything = ['Base', 'Derived', 'Other', 'Skipped']
+
+
+def test_first_run(run, tmp_path):
+    assert run() == (everything, ['Base.txt', 'Derived.txt', 'Other.txt'])
+    assert not (tmp_path / 'out' / 'Skipped.txt').exists()
+
+
+def test_unchanged(run):
+    run()
+    assert run() == ([], [])
+
+
+def test_edited_class(run, tmp_path):
+    run()
+    _edit(tmp_path, 'void o();', 'void o(); void o2();')
+    assert run() == (['Other'], ['Other.txt'])
+    assert (tmp_path / 'out' / 'Other.txt').read_text().strip() == 'Other: o o2'
+
+
+def test_edited_hierarchy(run, tmp_path):
+    run()
+    _edit(tmp_path, 'void d();', 'void d(); void d2();')
+    # Base refers to Derived through derived_classes, but renders the same
+    assert run() == (['Base', 'Derived'], ['Derived.txt'])
+    assert run() == ([], [])
+
+
+def test_template_changed(run, tmp_path):
+    run()
+    with open(str(tmp_path / 'cls.j2'), 'a') as fp:
+        fp.write('// changed\n')
+    assert run() == (everything, ['Base.txt', 'Derived.txt', 'Other.txt'])
+
+
+def test_deleted_output(run, tmp_path):
+    run()
+    os.unlink(str(tmp_path / 'out' / 'Derived.txt'))
+    assert run() == (['Derived'], ['Derived.txt'])
+
+
+def test_skipped_stays_skipped(run, tmp_path):
+    run()
+    _edit(tmp_path, 'void o();', 'void o(); void o2();')
+    assert 'Skipped' not in run()[0]
+    assert not (tmp_path / 'out' / 'Skipped.txt').exists()
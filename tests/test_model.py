@@ -0,0 +1,105 @@
+import sys
+
+import pytest
+
+from header2whatever.parse import main
+
+header = '''
+#pragma once
+#include <vector>
+
+namespace ns {
+
+/// A base class
+class Base {
+public:
+    virtual ~Base();
+    /** Does something */
+    virtual int run(int count, const char *name = "x") const = 0;
+protected:
+    int value;
+};
+
+enum Color { Red, Green = 5, Blue };
+
+class Derived : public Base {
+public:
+    struct Nested { int n; };
+    int run(int count, const char *name) const override;
+    static Derived *create();
+    std::vector<Nested> items;
+private:
+    enum { Anon = 1 };
+};
+
+typedef Derived Alias;
+class Third : public Alias {};
+
+int free_function(double d);
+extern int counter;
+
+}
+'''
+
+template = '''{% for h in headers %}
+{{ h.fname }} {{ h.includes }} {{ h.pragmas }}
+{% for cls in h.classes %}
+{{ cls.name }} {{ cls.namespace }} {{ cls.line_number }} {{ cls.doxygen|default('') }}
+  bases: {% for b in cls.base_classes %}{{ b.name }} {% endfor %}
+  derived: {% for b in cls.derived_classes %}{{ b.name }} {% endfor %}
+  ancestors: {% for b in cls.ancestors %}{{ b.name }} {% endfor %}
+  parent: {{ cls.parent.name if cls.parent else '' }}
+  {% for access in ['public', 'protected', 'private'] %}
+  {% for m in cls.methods[access] %}
+  {{ access }} {{ m.rtnType }} {{ m.name }}({% for p in m.parameters %}{{ p.type }} {{ p.name }}={{ p.defaultValue|default('') }}, {% endfor %}) {{ m.const }} {{ m.virtual }} {{ m.static }} {{ m.doxygen|default('') }}
+  {% endfor %}
+  {% for p in cls.properties[access] %}
+  {{ access }} {{ p.type }} {{ p.name }}
+  {% endfor %}
+  {% for e in cls.enums[access] %}
+  {{ access }} enum {{ e.name|default('') }} {% for v in e['values'] %}{{ v.name }}={{ v.value }} {% endfor %}
+  {% endfor %}
+  {% endfor %}
+{% endfor %}
+{% for e in h.enums %}enum {{ e.name }} {% for v in e['values'] %}{{ v.name }}={{ v.value }} {% endfor %}
+{% endfor %}
+{% for f in h.functions %}{{ f.rtnType }} {{ f.name }} {{ f.namespace }}
+{% endfor %}
+{% for v in h.variables %}{{ v.type }} {{ v.name }}
+{% endfor %}
+{% for name, f in h.by_file.items() %}{{ name }}: {{ f.classes|map(attribute='name')|list }}
+{% endfor %}
+{% endfor %}
+{{ symbols.find_class('Alias', 'ns').name }} {{ symbols.classes|list|sort }}
+{{ symbols.enums|list|sort }} {{ symbols.typedefs }} {{ symbols.functions|list }}
+'''
+
+
+def _h2w(monkeypatch, *args):
+    monkeypatch.setattr(sys, 'argv', ['h2w'] + list(args))
+    main()
+
+
+@pytest.fixture
+def files(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'h.h').write_text(header)
+    (tmp_path / 't.j2').write_text(template)
+
+
+def test_render_from_model(files, monkeypatch, tmp_path):
+    _h2w(monkeypatch, '-o', 'direct.txt', 't.j2', 'h.h')
+    _h2w(monkeypatch, 'parse', 'h.h', '-o', 'model.json')
+    _h2w(monkeypatch, 'render', 'model.json', 't.j2', '-o', 'split.txt')
+
+    direct = (tmp_path / 'direct.txt').read_text()
+    assert 'Derived' in direct and 'Third' in direct
+    assert (tmp_path / 'split.txt').read_text() == direct
+
+
+def test_dump_from_model(files, monkeypatch, tmp_path):
+    _h2w(monkeypatch, '-o', 'direct.json', 'json', 'h.h')
+    _h2w(monkeypatch, 'parse', 'h.h', '-o', 'model.json')
+    _h2w(monkeypatch, 'render', 'model.json', 'json', '-o', 'split.json')
+
+    assert (tmp_path / 'split.json').read_text() == (tmp_path / 'direct.json').read_text()
@@ -0,0 +1,44 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from header2whatever.config import Config
+from header2whatever.parse import _strip_ignored_symbols, parse_config
+
+
+def _summary(tmp_path, i):
+    fname = tmp_path / ('h%d.h' % i)
+    fname.write_text(''.join('class C%d_%d { public: int m%d(int x); };\n' % (i, j, j)
+                             for j in range(50)))
+    cfg = Config()
+    cfg.headers = [str(fname)]
+    cfg.validate()
+    header = parse_config(cfg)['header']
+    return [(c['name'], [m['name'] for m in c['methods']['public']]) for c in header.classes]
+
+
+def test_concurrent_configs(tmp_path):
+    expected = [_summary(tmp_path, i) for i in range(8)]
+    with ThreadPoolExecutor(8) as executor:
+        results = list(executor.map(lambda i: _summary(tmp_path, i), list(range(8)) * 4))
+    assert results == expected * 4
+
+
+def test_strip_ignored_symbols():
+    contents = '\n'.join([
+        '/** uses FOO(x) and API */',
+        'class API Foo {',
+        '    FOO(1, ")", g(\')\'),',
+        '        "(") void f(const char *s = "API");',
+        '    API int y; // FOO(y',
+        '};',
+        'FOO(unbalanced',
+    ])
+    stripped = _strip_ignored_symbols(contents, ['API', 'FOO()'])
+    assert stripped.split('\n') == [
+        '/** uses FOO(x) and API */',
+        'class     Foo {',
+        '    ',
+        ' void f(const char *s = "API");',
+        '        int y; // FOO(y',
+        '};',
+        'FOO(unbalanced',
+    ]
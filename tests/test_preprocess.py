@@ -0,0 +1,133 @@
+import shutil
+
+import pytest
+
+from header2whatever.config import Config
+from header2whatever.parse import PreprocessorError, parse_header
+from header2whatever.preprocess import preprocess_file
+
+
+@pytest.mark.skipif(shutil.which('gcc') is None, reason='gcc is not installed')
+@pytest.mark.parametrize('retain', [False, True])
+def test_compiler_includes(tmp_path, monkeypatch, retain):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'inc').mkdir()
+    (tmp_path / 'inc' / 'local.h').write_text('#pragma once\nint inner;\n')
+    (tmp_path / 'inc' / 'other.h').write_text('int other;\n#include <stdbool.h>\n')
+    (tmp_path / 'm.h').write_text('\n'.join([
+        '// top',
+        '#include <stddef.h>',
+        '',
+        '#include "inc/local.h"',
+        '#include <other.h>',
+        'int x;',
+        '#include \\',
+        '  <stdint.h>',
+        'int y;',
+        '',
+    ]))
+
+    def parse(backend):
+        cfg = Config()
+        cfg.headers = ['m.h']
+        cfg.preprocess = True
+        cfg.pp_include_paths = ['inc']
+        cfg.pp_backend = backend
+        cfg.pp_retain_all_content = retain
+        cfg.validate()
+        header = parse_header(cfg, 'm.h')
+        return header.includes_detail, [(v['name'], v['line_number']) for v in header.variables]
+
+    expected = parse('pcpp')
+    includes = ['<stddef.h>', '<stdbool.h>', '<stdint.h>'] if retain else ['<stddef.h>', '<stdint.h>']
+    assert [d['value'] for d in expected[0]] == includes
+    assert parse('gcc') == expected
+
+
+doxygen_header = '''#define X 1
+/// doc for f
+// plain
+void f();
+
+/// doc for g
+
+void g();
+
+/** doc for h */ /* plain */ void h();
+
+/// doc for i
+/* plain
+   block */
+int i;
+
+/// doc for k
+void k(); // trailing
+
+// plain before doc
+/// doc for m
+void m();
+
+class C {
+    /// doc for a
+    // plain
+    void a();
+    //! doc for b
+    void b(); /* plain */
+};
+'''
+
+
+def test_doxygen_comments(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'd.h').write_text(doxygen_header)
+
+    def parse(comments):
+        cfg = Config()
+        cfg.headers = ['d.h']
+        cfg.preprocess = True
+        cfg.pp_comments = comments
+        cfg.validate()
+        header = parse_header(cfg, 'd.h')
+        items = header.functions + header.variables + \
+            [m for c in header.classes for m in c['methods']['public'] + c['methods']['private']]
+        return [(i['name'], i.get('doxygen'), i['line_number']) for i in items]
+
+    expected = parse('all')
+    assert ('f', '/// doc for f', 4) in expected
+    assert parse('doxygen') == expected
+
+
+def test_doxygen_comment_text(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'd.h').write_text(doxygen_header)
+    contents = preprocess_file('d.h', comments='doxygen')
+    assert 'plain' not in contents and 'trailing' not in contents
+    assert 'doc for i' in contents
+
+
+@pytest.mark.parametrize('value, expected', [('', ('Jan', 1, '1970')), ('86400', ('Jan', 2, '1970'))])
+def test_source_date_epoch(tmp_path, monkeypatch, value, expected):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('SOURCE_DATE_EPOCH', value)
+    (tmp_path / 'e.h').write_text('const char *date = __DATE__;\n')
+    cfg = Config()
+    cfg.headers = ['e.h']
+    cfg.preprocess = True
+    cfg.pp_reproducible = True
+    cfg.validate()
+    header = parse_header(cfg, 'e.h')
+    month, day, year = header.variables[0]['default'].strip('"').split()
+    assert (month, int(day), year) == expected
+
+
+def test_bad_source_date_epoch(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('SOURCE_DATE_EPOCH', 'yesterday')
+    (tmp_path / 'e.h').write_text('const char *date = __DATE__;\n')
+    cfg = Config()
+    cfg.headers = ['e.h']
+    cfg.preprocess = True
+    cfg.pp_reproducible = True
+    cfg.validate()
+    with pytest.raises(PreprocessorError, match="SOURCE_DATE_EPOCH.*'yesterday'"):
+        parse_header(cfg, 'e.h')
@@ -0,0 +1,46 @@
+import pytest
+
+from header2whatever.scan import select_declarations, strip_function_bodies
+
+
+@pytest.mark.parametrize('decl', [
+    'class Foo {',
+    'class API Foo {',
+    'class Foo final : public Base {',
+    'struct __attribute__((packed)) Foo {',
+    'struct alignas(16) Foo {',
+    'struct [[deprecated]] Foo {',
+    'template <> class Foo<int> {',
+])
+def test_select_class(decl):
+    contents = decl + ' int x; };\nclass Other { int y; };\n'
+    selected = select_declarations(contents, classes=['Foo'])
+    assert 'int x;' in selected
+    assert 'Other' not in selected
+    assert selected.count('\n') == contents.count('\n')
+
+
+@pytest.mark.parametrize('decl', [
+    'alignas(8) int c{9};',
+    '__attribute__((aligned(8))) int b{7};',
+    '__declspec(align(8)) int a{6};',
+    'decltype(x) y{1, 2};',
+])
+def test_keep_initializers(decl):
+    contents = 'struct S {\n    %s\n};\n' % decl
+    assert strip_function_bodies(contents) == contents
+
+
+@pytest.mark.parametrize('decl', [
+    'int f() { return 1; }',
+    'decltype(auto) f() { return 1; }',
+    '__attribute__((always_inline)) int f() { return 1; }',
+    'auto f() -> decltype(x) { return x; }',
+])
+def test_strip_bodies(decl):
+    assert strip_function_bodies('struct S {\n    %s\n};\n' % decl).count('return') == 0
+
+
+def test_strip_bodies_keeps_line_directives():
+    contents = 'inline int f() {\n  int a;\n#line 20 "x.h"\n  return a;\n}\nint after;\n'
+    assert strip_function_bodies(contents) == 'inline int f() {\n\n#line 20 "x.h"\n\n}\nint after;\n'
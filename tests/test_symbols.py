@@ -0,0 +1,68 @@
+from header2whatever.config import Config
+from header2whatever.parse import parse_config
+from header2whatever.symbols import SymbolIndex
+
+header = '''
+struct B { int top; };
+struct Outer {
+    struct B { int x; };
+    struct D : B {};
+    struct In { struct C {}; };
+    struct E : In::C {};
+};
+namespace N {
+struct Outer2 {
+    struct B2 {};
+    struct In2 { struct C2 {}; struct F : C2 {}; struct G : B2 {}; };
+};
+}
+struct H : Outer::In::C {};
+'''
+
+
+def test_nested_bases(tmp_path):
+    (tmp_path / 'n.h').write_text(header)
+    cfg = Config()
+    cfg.headers = [str(tmp_path / 'n.h')]
+    cfg.validate()
+    symbols = parse_config(cfg)['symbols']
+
+    def bases(name):
+        return [b for b in symbols.classes[name].base_classes]
+
+    assert bases('Outer::D') == [symbols.classes['Outer::B']]
+    assert bases('Outer::D')[0] is not symbols.classes['B']
+    assert bases('Outer::E') == [symbols.classes['Outer::In::C']]
+    assert bases('N::Outer2::In2::F') == [symbols.classes['N::Outer2::In2::C2']]
+    assert bases('N::Outer2::In2::G') == [symbols.classes['N::Outer2::B2']]
+    assert bases('H') == [symbols.classes['Outer::In::C']]
+
+
+class _Class(dict):
+    pass
+
+
+def _cls(name, namespace='', parent=None, inherits=()):
+    return _Class({'name': name, 'namespace': namespace, 'parent': parent,
+            'inherits': [{'decl_name': i} for i in inherits],
+            'enums': {'public': [], 'protected': [], 'private': []}})
+
+
+def test_nested_scope():
+    # the namespace of a nested class doesn't have to include its parent
+    class Header:
+        enums = functions = []
+        typedefs = using = {}
+
+    outer = _cls('Outer')
+    b = _cls('B', parent=outer)
+    d = _cls('D', parent=outer, inherits=['B'])
+    top = _cls('B')
+    Header.classes = [top, outer, b, d]
+
+    symbols = SymbolIndex()
+    symbols.add_header(Header)
+    symbols.resolve_hierarchy()
+    assert symbols.classes['B'] is top
+    assert symbols.classes['Outer::B'] is b
+    assert len(d.base_classes) == 1 and d.base_classes[0] is b
@@ -0,0 +1,15 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+
+from header2whatever.util import write_atomic
+
+
+def test_write_atomic_threads(tmp_path):
+    fname = str(tmp_path / 'out.txt')
+    contents = ['%d\n' % i * 10000 for i in range(16)]
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(lambda c: write_atomic(fname, c), contents * 8))
+
+    with open(fname, encoding='utf-8') as fp:
+        assert fp.read() in contents
+    assert os.listdir(str(tmp_path)) == ['out.txt']